@@ -15,23 +15,129 @@ Other modules (1) will send requests to it sending it:
 3. Predicted trajectory coordinates + Decision
 
 Our server will process the video file and return a new video output.mp4
+
+Rendering takes a while, so there is also an asynchronous version of the same endpoint:
+1. POST /stream-overlay/jobs with the same files returns a job ID straight away (202)
+2. GET /stream-overlay/jobs/<job_id> reports whether the job is queued, running, done or failed
+3. GET /stream-overlay/jobs/<job_id>/result returns the video once the job is done
+Submit with draft=1 (form field or query parameter) for a quick look: the full render is queued first, and a
+half-size draft at normal speed is rendered alongside it before the 202 comes back. The result URL serves the
+draft (X-Render-Quality: draft) until the full render replaces it (X-Render-Quality: full). The job status
+reports both latencies, draft_elapsed and elapsed.
+Jobs render on a pool of STREAM_OVERLAY_WORKERS processes. When STREAM_OVERLAY_MAX_PENDING jobs
+are already waiting, new submissions are rejected with 503 so clients can retry later.
+
+Rendered videos are cached on disk (STREAM_OVERLAY_CACHE_DIR, at most STREAM_OVERLAY_CACHE_BYTES), keyed
+by the video bytes, the JSON contents and the render settings, so repeated requests for the same delivery
+skip rendering. GET /stream-overlay/cache reports hit/miss counts. The compiled render plan of each pair of JSON
+files is kept too (STREAM_OVERLAY_PLAN_DIR, at most STREAM_OVERLAY_PLAN_BYTES), so a delivery re-rendered with other output settings is not
+planned again.
+
+POST /stream-overlay/stream takes the same files but streams in both directions: the video is decoded
+while it is still uploading (send the two JSON parts before the video part for this, and use a container
+that can be read front to back: AVI, MKV/WebM, MPEG-TS or fragmented MP4; other videos, such as a regular MP4,
+are received in full first), and the overlaid frames come back as a multipart/x-mixed-replace MJPEG stream as
+soon as each one is rendered. A video that cannot be decoded is answered with 400.
+
+Set STREAM_OVERLAY_ENCODER=ffmpeg to encode H.264 MP4 through a local ffmpeg instead of XVID AVI through
+OpenCV (STREAM_OVERLAY_FFMPEG_PRESET and STREAM_OVERLAY_FFMPEG_CRF tune size against encode speed).
+
+GET /metrics reports render latencies, error counts, job queue depth and cache hits in the
+Prometheus text format.
+
+At startup the server draws the common decision boxes and starts the job workers, so neither the first
+request nor the first job pays for loading OpenCV or starting a process. Set STREAM_OVERLAY_WARM_POOL=0
+to start workers on demand instead. Importing the app does not warm anything: python app.py does it itself,
+and other servers should call warm_workers() in each serving process once it has started (e.g. from
+gunicorn's post_worker_init hook), not before forking.
 '''
 
 
 import os
+import shutil
 import tempfile
-from flask import Flask, request, send_file
-from stream_overlay import TrajectoryOverlayRenderer
+import time
+from flask import Flask, Response, jsonify, request, send_file, url_for
+from stream_overlay import warm_up
+from stream_overlay.cache import RenderCache
+from stream_overlay.jobs import QueueFullError, RenderJobQueue, render_settings
+from stream_overlay.metrics import MetricsRegistry
+from stream_overlay.formats import BACKEND_FORMATS
+from stream_overlay.streaming import MJPEG_BOUNDARY, StreamingUpload, mjpeg_stream
 
 app = Flask(__name__)
 
+REQUIRED_FILES = ('video', 'module5_output_json', 'module4_output_json')
+
+OUTPUT_BACKEND = os.environ.get('STREAM_OVERLAY_ENCODER', 'opencv')
+OUTPUT_ENCODER = {}
+if OUTPUT_BACKEND == 'ffmpeg':
+    OUTPUT_ENCODER = {
+        'preset': os.environ.get('STREAM_OVERLAY_FFMPEG_PRESET', 'veryfast'),
+        'crf': int(os.environ.get('STREAM_OVERLAY_FFMPEG_CRF', 23))
+    }
+OUTPUT_EXTENSION, OUTPUT_MIMETYPE = BACKEND_FORMATS[OUTPUT_BACKEND]
+OUTPUT_NAME = 'augmented_video' + OUTPUT_EXTENSION
+
+render_cache = RenderCache(
+    os.environ.get('STREAM_OVERLAY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'stream_overlay_cache')),
+    max_bytes=int(os.environ.get('STREAM_OVERLAY_CACHE_BYTES', 2 * 1024 ** 3)),
+    extension=OUTPUT_EXTENSION
+)
+
+PLAN_CACHE_DIR = os.environ.get('STREAM_OVERLAY_PLAN_DIR',
+                                os.path.join(tempfile.gettempdir(), 'stream_overlay_plans'))
+PLAN_CACHE_BYTES = int(os.environ.get('STREAM_OVERLAY_PLAN_BYTES', 64 * 1024 ** 2))
+
+metrics = MetricsRegistry()
+render_latency = metrics.histogram('stream_overlay_render_seconds', "Time from request to rendered video, by endpoint")
+render_errors = metrics.counter('stream_overlay_errors_total', "Failed renders and requests, by endpoint")
+jobs_rejected = metrics.counter('stream_overlay_jobs_rejected_total', "Jobs turned away because the queue was full")
+
+
+def record_job(job):
+    if job.status == 'failed':
+        render_errors.inc(endpoint='jobs')
+    else:
+        render_latency.observe(job.finished_at - job.submitted_at, endpoint='jobs')
+
+
+render_jobs = RenderJobQueue(
+    max_workers=int(os.environ.get('STREAM_OVERLAY_WORKERS', 2)),
+    max_pending=int(os.environ.get('STREAM_OVERLAY_MAX_PENDING', 8)),
+    cache=render_cache,
+    on_finish=record_job,
+    backend=OUTPUT_BACKEND,
+    encoder=OUTPUT_ENCODER,
+    plan_cache=PLAN_CACHE_DIR,
+    plan_cache_bytes=PLAN_CACHE_BYTES
+)
+
+
+
+def warm_workers():
+    # Called once the serving process is up (never at import, so importing the app forks nothing)
+    if os.environ.get('STREAM_OVERLAY_WARM_POOL', '1') != '0':
+        # warmed before the workers fork, so they start with the sprites already cached
+        warm_up()
+        render_jobs.warm()
+
+metrics.callback('stream_overlay_jobs_pending', "Render jobs queued or running", render_jobs.pending_count)
+metrics.callback('stream_overlay_jobs_max_pending', "Jobs accepted before new ones are rejected",
+                 lambda: render_jobs.max_pending)
+metrics.callback('stream_overlay_cache_hits_total', "Render cache hits", lambda: render_cache.hits, kind='counter')
+metrics.callback('stream_overlay_cache_misses_total', "Render cache misses", lambda: render_cache.misses,
+                 kind='counter')
+
 @app.route('/stream-overlay', methods=['POST'])
 def augment_video():
+    # OpenCV is loaded with the renderer by the first render, not when the app is imported
+    from stream_overlay import TrajectoryOverlayRenderer
+
+    started = time.perf_counter()
     try:
         # Ensure required files are in the request
-        if 'video' not in request.files or \
-           'module5_output_json' not in request.files or \
-           'module4_output_json' not in request.files:
+        if any(name not in request.files for name in REQUIRED_FILES):
             return "Missing required files", 400
 
         '''
@@ -41,31 +147,183 @@ def augment_video():
             video_path = os.path.join(temp_dir, 'input.avi')
             bounce_path = os.path.join(temp_dir, 'module5_output.json')
             trajectory_path = os.path.join(temp_dir, 'module4_output.json')
-            output_path = os.path.join(temp_dir, 'output.avi')
+            output_path = os.path.join(temp_dir, 'output' + OUTPUT_EXTENSION)
 
             # Save uploaded files
             request.files['video'].save(video_path)
             request.files['module5_output_json'].save(bounce_path)
             request.files['module4_output_json'].save(trajectory_path)
 
+            # Replays of the same delivery come straight from the cache
+            cache_key = render_cache.make_key(video_path, trajectory_path, bounce_path,
+                                              render_settings(3, backend=OUTPUT_BACKEND, encoder=OUTPUT_ENCODER))
+            cached_path = render_cache.get(cache_key, copy_to=output_path)
+            if cached_path is not None:
+                render_latency.observe(time.perf_counter() - started, endpoint='sync')
+                return send_file(cached_path, mimetype=OUTPUT_MIMETYPE,
+                                 as_attachment=True, download_name=OUTPUT_NAME)
+
             # Run the overlay renderer
             renderer = TrajectoryOverlayRenderer(
                 video_path=video_path,
                 module4_json=trajectory_path, 
                 module5_json=bounce_path,
                 output_path=output_path,
-                slow_factor=3
+                slow_factor=3,
+                backend=OUTPUT_BACKEND,
+                encoder=OUTPUT_ENCODER,
+                plan_cache=PLAN_CACHE_DIR,
+                plan_cache_bytes=PLAN_CACHE_BYTES
             )
             renderer.run()
+            try:
+                render_cache.put(cache_key, output_path)
+            except OSError:
+                pass  # a failed cache write must not fail the render
+            render_latency.observe(time.perf_counter() - started, endpoint='sync')
 
             # Return the processed video
-            return send_file(output_path, mimetype='video/x-msvideo',
-                             as_attachment=True, download_name='augmented_video.avi')
+            return send_file(output_path, mimetype=OUTPUT_MIMETYPE,
+                             as_attachment=True, download_name=OUTPUT_NAME)
 
     except KeyError:
         return "Missing required files", 400
     except Exception as e:
+        render_errors.inc(endpoint='sync')
+        return f"An error occurred: {e}", 500
+
+
+@app.route('/stream-overlay/jobs', methods=['POST'])
+def submit_overlay_job():
+    if any(name not in request.files for name in REQUIRED_FILES):
+        return "Missing required files", 400
+
+    try:
+        job = render_jobs.create_job()
+    except QueueFullError as e:
+        # Backpressure: tell the client to come back instead of piling up work
+        jobs_rejected.inc()
+        return jsonify(error=str(e)), 503, {'Retry-After': '5'}
+
+    try:
+        request.files['video'].save(job.video_path)
+        request.files['module5_output_json'].save(job.module5_json)
+        request.files['module4_output_json'].save(job.module4_json)
+        draft = request.values.get('draft', '').lower() in ('1', 'true', 'yes')
+        render_jobs.submit(job, slow_factor=3, draft=draft)
+    except Exception as e:
+        render_jobs.discard(job.id)
+        render_errors.inc(endpoint='jobs')
         return f"An error occurred: {e}", 500
 
+    if job.draft_ready_at is not None:
+        render_latency.observe(job.draft_ready_at - job.submitted_at, endpoint='draft')
+    return jsonify(
+        job_id=job.id,
+        status=job.status,
+        draft_elapsed=job.to_dict()["draft_elapsed"],
+        status_url=url_for('overlay_job_status', job_id=job.id),
+        result_url=url_for('overlay_job_result', job_id=job.id)
+    ), 202
+
+
+@app.route('/stream-overlay/jobs/<job_id>', methods=['GET'])
+def overlay_job_status(job_id):
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/stream-overlay/jobs/<job_id>/result', methods=['GET'])
+def overlay_job_result(job_id):
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job.status == 'failed':
+        return jsonify(job.to_dict()), 500
+    if job.status == 'done':
+        path, quality = job.output_path, 'full'
+    elif job.draft_ready_at is not None:
+        path, quality = job.draft_path, 'draft'
+    else:
+        return jsonify(job.to_dict()), 409
+    response = send_file(path, mimetype=OUTPUT_MIMETYPE, as_attachment=True, download_name=OUTPUT_NAME)
+    response.headers['X-Render-Quality'] = quality
+    return response
+
+
+@app.route('/stream-overlay/cache', methods=['GET'])
+def render_cache_stats():
+    return jsonify(render_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/stream-overlay/stream', methods=['POST'])
+def stream_overlay_video():
+    from stream_overlay import TrajectoryOverlayRenderer
+
+    started = time.perf_counter()
+    json_parts = ('module4_output_json', 'module5_output_json')
+    work_dir = tempfile.mkdtemp(prefix='stream_overlay_')
+    upload = None
+    try:
+        upload = StreamingUpload(request.stream, request.content_type, work_dir)
+        video_path = upload.open(expected_parts=json_parts)
+        if video_path is None or any(name not in upload.parts for name in json_parts):
+            raise KeyError("Missing required files")
+
+        json_paths = {}
+        for name in json_parts:
+            json_paths[name] = os.path.join(work_dir, name + '.json')
+            with open(json_paths[name], 'wb') as f:
+                f.write(upload.parts[name])
+
+        renderer = TrajectoryOverlayRenderer(
+            video_path=video_path,
+            module4_json=json_paths['module4_output_json'],
+            module5_json=json_paths['module5_output_json'],
+            output_path=None,
+            slow_factor=3,
+            plan_cache=PLAN_CACHE_DIR,
+            plan_cache_bytes=PLAN_CACHE_BYTES
+        )
+        # the first part is rendered before answering, so an undecodable video is an error rather than an empty stream
+        parts = mjpeg_stream(renderer)
+        first_part = next(parts)
+    except (KeyError, ValueError) as e:
+        if upload is not None:
+            upload.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return f"Bad upload: {e}", 400
+    except Exception as e:
+        if upload is not None:
+            upload.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        render_errors.inc(endpoint='stream')
+        return f"An error occurred: {e}", 500
+
+    def generate():
+        try:
+            yield first_part
+            yield from parts
+            render_latency.observe(time.perf_counter() - started, endpoint='stream')
+        except Exception:
+            render_errors.inc(endpoint='stream')
+            raise
+        finally:
+            upload.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return Response(generate(), mimetype=f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}')
+
+
 if __name__ == "__main__":
+    # the debug reloader runs this twice; only the child that serves requests (not the file watcher) warms up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_workers()
     app.run(debug=True)
@@ -1,64 +1,252 @@
-import cv2
+import argparse
+import collections
 import json
 
-def main(video_path, output_json):
-    cap = cv2.VideoCapture(video_path)
-    cv2.namedWindow('Frame', cv2.WINDOW_NORMAL)
-    frame_number = 0
-    predicted_path = []
+import cv2
+import numpy as np
+
+# decoded frames kept for seeking back and forth, in bytes (about 80 frames at 1080p)
+FRAME_CACHE_BYTES = 512 * 1024 ** 2
+# half size of the patch around the ball that is looked for in the next frame
+TEMPLATE_RADIUS = 10
+# how far from its predicted position the ball is looked for
+SEARCH_RADIUS = 48
+# weaker matches count as lost, so the operator has to click
+MIN_MATCH_SCORE = 0.6
+# previous points drawn as a trail behind the current one
+TRAIL_LENGTH = 15
+
+CLICK_COLOR = (0, 255, 0)
+AUTO_COLOR = (0, 255, 255)
+
+
+class FrameCache:
+    '''
+    Random access to the frames of a video, with the most recently used frames
+    kept decoded (up to max_bytes) so stepping back and forth is instant.
+
+    Stepping forward reads on from the current position; any other jump seeks.
+    '''
+
+    def __init__(self, cap, max_bytes=FRAME_CACHE_BYTES):
+        self.cap = cap
+        self.max_bytes = max_bytes
+        self.frames = collections.OrderedDict()
+        self.next_index = 0  # frame the capture would decode next
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+
+    def _decode(self, index):
+        if index != self.next_index:
+            if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, index) or \
+                    int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+                # the backend cannot seek, so start over and skip frames without decoding them
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                for _ in range(index):
+                    if not self.cap.grab():
+                        break
+        ret, frame = self.cap.read()
+        self.next_index = index + 1 if ret else -1
+        if not ret and (self.frame_count is None or index < self.frame_count):
+            self.frame_count = index
+        return frame if ret else None
+
+    def get(self, index):
+        # The frame at index, or None past the end of the video
+        if index < 0 or (self.frame_count is not None and index >= self.frame_count):
+            return None
+        frame = self.frames.get(index)
+        if frame is not None:
+            self.frames.move_to_end(index)
+            return frame
+        frame = self._decode(index)
+        if frame is None:
+            return None
+        self.frames[index] = frame
+        while len(self.frames) > 1 and len(self.frames) * frame.nbytes > self.max_bytes:
+            self.frames.popitem(last=False)
+        return frame
+
+
+def _patch(image, point, radius):
+    # Region of image around point, clipped to the image, and its top-left corner
+    height, width = image.shape[:2]
+    x0, y0 = max(point[0] - radius, 0), max(point[1] - radius, 0)
+    x1, y1 = min(point[0] + radius + 1, width), min(point[1] + radius + 1, height)
+    return image[y0:y1, x0:x1], (x0, y0)
+
+
+def propagate(previous_frame, previous_point, frame, velocity=(0, 0),
+              template_radius=TEMPLATE_RADIUS, search_radius=SEARCH_RADIUS, min_score=MIN_MATCH_SCORE):
+    '''
+    Finds the ball in frame from where it was in previous_frame.
+
+    The patch around previous_point is matched inside a search window around
+    previous_point + velocity (the ball's last per-frame movement). Returns the
+    new (x, y), or None when nothing in the window matches well enough.
+    '''
+    previous_gray = cv2.cvtColor(previous_frame, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    template, (tx, ty) = _patch(previous_gray, previous_point, template_radius)
+    center = (previous_point[0] + int(velocity[0]), previous_point[1] + int(velocity[1]))
+    window, (wx, wy) = _patch(gray, center, search_radius + template_radius)
+    if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+        return None
+    scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+    if not np.isfinite(score) or score < min_score:
+        return None
+    return wx + mx + previous_point[0] - tx, wy + my + previous_point[1] - ty
+
+
+class TrackingSession:
+    '''
+    Ball positions labelled so far, by frame number, each marked as clicked by
+    the operator or propagated from the frame before.
+    '''
 
+    def __init__(self, frames, fps, assisted=True):
+        self.frames = frames
+        self.fps = fps
+        self.assisted = assisted
+        self.points = {}  # frame -> (x, y)
+        self.clicked = set()  # frames whose point the operator placed
+
+    def click(self, index, point):
+        # A click replaces the point, and drops the propagated points after it up to the next click
+        self.points[index] = point
+        self.clicked.add(index)
+        following = index + 1
+        while following in self.points and following not in self.clicked:
+            del self.points[following]
+            following += 1
+
+    def clear(self, index):
+        self.points.pop(index, None)
+        self.clicked.discard(index)
+
+    def advance(self, index):
+        '''
+        Propagates the ball from frame index - 1 into frame index if assisted
+        tracking is on and the frame has no point yet. Returns whether frame
+        index ends up with a point.
+        '''
+        if index in self.points:
+            return True
+        if not self.assisted or index - 1 not in self.points:
+            return False
+        previous, frame = self.frames.get(index - 1), self.frames.get(index)
+        if previous is None or frame is None:
+            return False
+        last = self.points[index - 1]
+        before = self.points.get(index - 2)
+        velocity = (last[0] - before[0], last[1] - before[1]) if before is not None else (0, 0)
+        point = propagate(previous, last, frame, velocity)
+        if point is None:
+            return False
+        self.points[index] = point
+        return True
+
+    def to_json(self):
+        # Points in frame order in the manual tracker schema, with their frame numbers and video timestamps
+        return [{
+            "pos_x": int(x),
+            "pos_y": int(y),
+            "pos_z": 0.0,
+            "timestamp": round(index / self.fps, 6) if self.fps > 0 else 0.0,
+            "frame": index
+        } for index, (x, y) in sorted(self.points.items())]
+
+
+def draw_view(frame, session, index):
+    view = frame.copy()
+    trail = [session.points[i] for i in range(index - TRAIL_LENGTH, index) if i in session.points]
+    for start, end in zip(trail, trail[1:]):
+        cv2.line(view, start, end, AUTO_COLOR, 1, cv2.LINE_AA)
+    if index in session.points:
+        color = CLICK_COLOR if index in session.clicked else AUTO_COLOR
+        cv2.circle(view, session.points[index], 5, color, -1)
+    total = session.frames.frame_count
+    status = f"frame {index}" + (f"/{total - 1}" if total else "") + ("  [assisted]" if session.assisted else "")
+    cv2.putText(view, status, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
+    return view
+
+
+def main(video_path, output_json, assisted=True, cache_bytes=FRAME_CACHE_BYTES):
+    cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print("Error: Cannot open video file.")
-        return 
+        return
+
+    session = TrackingSession(FrameCache(cap, cache_bytes), cap.get(cv2.CAP_PROP_FPS), assisted)
+    cv2.namedWindow('Frame', cv2.WINDOW_NORMAL)
 
     print("Instructions:")
-    print("- Click on the ball in every frame where it is visible.")
-    print("- Press any key to go to next frame.")
-    print("- If ball is not visible in a frame, just press any key (no click).")
-    print("- Close window or press 'q' to exit early.")
+    print("- Click on the ball to place (or correct) its position in the current frame.")
+    print("- 'd' or space: next frame, 'a': previous frame, 'x': remove the point on this frame.")
+    if assisted:
+        print("- The ball is followed from frame to frame; only click where it drifts off.")
+        print("- 'p': play forward while the ball is followed, any key stops.")
+    print("- Close window or press 'q' to save and exit.")
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    index = 0
+    playing = False
 
-        coords = []
+    def click_event(event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            session.click(index, (x, y))
 
-        def click_event(event, x, y, flags, param):
-            if event == cv2.EVENT_LBUTTONDOWN:
-                coords.append((x, y))
-                cv2.circle(frame, (x, y), 5, (0, 255, 0), -1)
-                cv2.imshow('Frame', frame)
+    cv2.setMouseCallback('Frame', click_event)
+    while True:
+        frame = session.frames.get(index)
+        if frame is None:
+            if index == 0:
+                break
+            index -= 1
+            playing = False
+            continue
 
-        cv2.imshow('Frame', frame)
-        cv2.setMouseCallback('Frame', click_event)
+        cv2.imshow('Frame', draw_view(frame, session, index))
+        key = cv2.waitKey(1 if playing else 30) & 0xFF
+        if cv2.getWindowProperty('Frame', cv2.WND_PROP_VISIBLE) < 1:
+            break
+        if playing:
+            if key != 0xFF:
+                playing = False
+            elif session.advance(index + 1):
+                index += 1
+            else:
+                playing = False  # lost the ball or reached the end
+            continue
 
-        key = cv2.waitKey(0)
         if key == ord('q'):
             break
-
-        if coords:
-            # Take the first click (ignore extras)
-            x, y = coords[0]
-            predicted_path.append({
-                "pos_x": int(x),
-                "pos_y": int(y),
-                "pos_z": 0.0,
-                "timestamp": 0.0
-            })
-
-        frame_number += 1
+        elif key in (ord('d'), ord(' ')):
+            session.advance(index + 1)
+            index += 1
+        elif key == ord('a'):
+            index = max(index - 1, 0)
+        elif key == ord('x'):
+            session.clear(index)
+        elif key == ord('p') and assisted:
+            playing = True
 
     cap.release()
     cv2.destroyAllWindows()
 
-    # Save to json
+    predicted_path = session.to_json()
     with open(output_json, "w") as outfile:
         json.dump(predicted_path, outfile, indent=4)
 
-    print(f"\nDone! {len(predicted_path)} points saved to {output_json}")
+    clicks = len(session.clicked & set(session.points))
+    print(f"\nDone! {len(predicted_path)} points ({clicks} clicked) saved to {output_json}")
+
 
 if __name__ == "__main__":
-    video_file = "input_video3.avi"          # <-- Change this to your actual video filename
-    output_file = "predicted_path.json"
-    main(video_file, output_file)
+    parser = argparse.ArgumentParser(description="Label the ball position in a delivery video.")
+    parser.add_argument('video', nargs='?', default="input_video3.avi")
+    parser.add_argument('output', nargs='?', default="predicted_path.json")
+    parser.add_argument('--manual', action='store_true', help="click every frame, without assisted tracking")
+    parser.add_argument('--cache-mb', type=int, default=FRAME_CACHE_BYTES // 1024 ** 2,
+                        help="memory for decoded frames kept for seeking")
+    args = parser.parse_args()
+    main(args.video, args.output, assisted=not args.manual, cache_bytes=args.cache_mb * 1024 ** 2)
@@ -0,0 +1,104 @@
+'''
+Checks that every way of running a render writes the same frames.
+
+    python benchmarks/check_equivalence.py
+
+A synthetic delivery is rendered inline, with render threads (workers=2) and
+with render processes (processes=2), for every trajectory schema, and the
+decoded outputs are compared frame by frame. Any difference in frame count,
+order or pixels is reported and the script exits with status 1, so a change
+to the layer, the plan or an executor cannot quietly reorder or alter frames.
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_overlay.draw_trajectory_new import TrajectoryOverlayRenderer  # noqa: E402
+from synthetic import SCHEMAS, make_delivery  # noqa: E402
+
+# executors compared against the inline render
+EXECUTORS = {"workers=2": {"workers": 2}, "processes=2": {"processes": 2}}
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def first_difference(expected, actual):
+    # Description of the first frame where actual differs from expected, or None when they match
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if not np.array_equal(a, b):
+            return f"frame {i} differs"
+    if len(expected) != len(actual):
+        return f"{len(actual)} frames, expected {len(expected)}"
+    return None
+
+
+def check_case(data_dir, out_dir, schema, width, height, points, slow_factor, options):
+    # Differences from the inline render, as (executor, description)
+    video, module4, module5 = make_delivery(data_dir, width, height, points=points, schema=schema)
+
+    def render(name, executor_options):
+        output = os.path.join(out_dir, f'{schema}_{name}.avi')
+        TrajectoryOverlayRenderer(video, module4, module5, output, slow_factor=slow_factor,
+                                  **options, **executor_options).run()
+        frames = read_frames(output)
+        os.remove(output)
+        return frames
+
+    expected = render('inline', {})
+    if not expected:
+        return [("inline", "no frames written")]
+    differences = []
+    for name, executor_options in EXECUTORS.items():
+        difference = first_difference(expected, render(name.replace('=', ''), executor_options))
+        if difference is not None:
+            differences.append((name, difference))
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that all render executors write identical frames.")
+    parser.add_argument('--schemas', type=lambda text: text.split(','), default=list(SCHEMAS))
+    parser.add_argument('--size', type=lambda text: tuple(int(v) for v in text.split('x')), default=(640, 360))
+    parser.add_argument('--points', type=int, default=40, help="trajectory points (frames)")
+    parser.add_argument('--slow-factor', type=int, default=3)
+    parser.add_argument('--interpolate', action='store_true', help="also check every schema with interpolate=True")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'stream_overlay_bench'),
+                        help="where synthetic deliveries are generated and reused")
+    args = parser.parse_args(argv)
+
+    option_sets = [{}] + ([{"interpolate": True}] if args.interpolate else [])
+    width, height = args.size
+    failures = 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        for schema in args.schemas:
+            for options in option_sets:
+                case = schema + ''.join(f"/{key}={value}" for key, value in sorted(options.items()))
+                differences = check_case(args.data_dir, out_dir, schema, width, height, args.points,
+                                         args.slow_factor, options)
+                for executor, difference in differences:
+                    print(f"MISMATCH {case} {executor}: {difference}")
+                if not differences:
+                    print(f"{case:<40} OK")
+                failures += len(differences)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
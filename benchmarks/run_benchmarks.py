@@ -0,0 +1,148 @@
+'''
+Times TrajectoryOverlayRenderer on synthetic deliveries.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.15
+
+Every combination of resolution, trajectory length, slow factor and schema is
+rendered --repeat times and the median wall time is kept, together with the
+per-stage p50/p95/p99 of the median run. With --baseline, cases that got more
+than --tolerance slower than the stored results are reported as regressions and
+the script exits with status 1.
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_overlay.draw_trajectory_new import TrajectoryOverlayRenderer  # noqa: E402
+from synthetic import SCHEMAS, make_delivery  # noqa: E402
+
+
+def _sizes(text):
+    return [tuple(int(v) for v in size.split('x')) for size in text.split(',')]
+
+
+def _ints(text):
+    return [int(v) for v in text.split(',')]
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+
+
+def case_name(width, height, points, slow_factor, schema, options):
+    name = f"{width}x{height}/{points}pts/slow{slow_factor}/{schema}"
+    for key, value in sorted(options.items()):
+        name += f"/{key}={value}"
+    return name
+
+
+def run_case(data_dir, out_dir, width, height, fps, points, slow_factor, schema, repeat, options):
+    video, module4, module5 = make_delivery(data_dir, width, height, fps, points, schema)
+    runs = []
+    for i in range(repeat):
+        output = os.path.join(out_dir, f'out_{i}.avi')
+        renderer = TrajectoryOverlayRenderer(video, module4, module5, output, slow_factor=slow_factor,
+                                             profile=True, **options)
+        runs.append(renderer.run())
+        os.remove(output)
+    runs.sort(key=lambda metrics: metrics["seconds"])
+    median = runs[len(runs) // 2]
+    return {
+        "case": case_name(width, height, points, slow_factor, schema, options),
+        "params": {"width": width, "height": height, "fps": fps, "points": points,
+                   "slow_factor": slow_factor, "schema": schema, **options},
+        "seconds": statistics.median(metrics["seconds"] for metrics in runs),
+        "runs": [metrics["seconds"] for metrics in runs],
+        "frames": median["frames"],
+        "fps": median["fps"],
+        "bytes_written": median["bytes_written"],
+        "peak_rss_bytes": median["peak_rss_bytes"],
+        "stages": median["stages"]
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Cases slower than the baseline by more than tolerance, as (case, baseline, current, ratio)
+    previous = {result["case"]: result["seconds"] for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["case"])
+        if before and result["seconds"] > before * (1 + tolerance):
+            regressions.append((result["case"], before, result["seconds"], result["seconds"] / before))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the trajectory overlay renderer.")
+    parser.add_argument('--resolutions', type=_sizes, default=_sizes('1280x720,1920x1080'))
+    parser.add_argument('--lengths', type=_ints, default=[60, 240], help="trajectory points (frames)")
+    parser.add_argument('--slow-factors', type=_ints, default=[1, 3])
+    parser.add_argument('--schemas', type=lambda text: text.split(','), default=list(SCHEMAS))
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--workers', type=_ints, default=[0], help="renderer workers to try, e.g. 0,2")
+    parser.add_argument('--shards', type=_ints, default=[0], help="shard processes to try, e.g. 0,4")
+    parser.add_argument('--interpolate', action='store_true', help="also run every case with interpolate=True")
+    parser.add_argument('--draft', action='store_true', help="also run every case as a draft render")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'stream_overlay_bench'),
+                        help="where generated inputs are kept between runs")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    option_sets = [{"workers": workers} if workers else {} for workers in args.workers]
+    option_sets += [{"shards": shards} for shards in args.shards if shards]
+    if args.interpolate:
+        option_sets += [dict(options, interpolate=True) for options in option_sets]
+    if args.draft:
+        option_sets += [dict(options, draft=True) for options in option_sets]
+
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for width, height in args.resolutions:
+            for points in args.lengths:
+                for slow_factor in args.slow_factors:
+                    for schema in args.schemas:
+                        for options in option_sets:
+                            result = run_case(args.data_dir, out_dir, width, height, args.fps, points,
+                                              slow_factor, schema, args.repeat, options)
+                            results.append(result)
+                            print(f"{result['case']:<60} {result['seconds']:8.3f}s {result['fps']:8.1f} frames/s")
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for case, before, after, ratio in regressions:
+            print(f"REGRESSION {case}: {before:.3f}s -> {after:.3f}s ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
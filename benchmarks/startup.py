@@ -0,0 +1,93 @@
+'''
+Measures start-up costs: importing the package, first use of the renderer, and
+the latency of a render job on a cold process pool against a warmed one.
+
+    python benchmarks/startup.py --output startup.json
+
+Import times are taken in fresh interpreters, so nothing is cached from
+earlier runs in the same process. Job latency is the time from submit to the
+finished output for a short synthetic delivery, for the first job on a new
+RenderJobQueue in a fresh interpreter, with and without warm() called
+beforehand; the difference is the per-job spin-up a warm pool saves.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_delivery  # noqa: E402
+
+IMPORT_SNIPPETS = {
+    "import_package": "import stream_overlay",
+    "import_jobs": "import stream_overlay.jobs",
+    "first_renderer_access": "import stream_overlay; stream_overlay.TrajectoryOverlayRenderer",
+    "warm_up": "import stream_overlay; stream_overlay.warm_up()"
+}
+
+
+def time_snippet(code):
+    # Seconds a fresh interpreter spends running code, without interpreter start-up itself
+    script = f"import time; t = time.perf_counter(); {code}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+JOB_SNIPPET = """
+from stream_overlay.jobs import RenderJobQueue, render_job
+queue = RenderJobQueue(max_workers=1)
+if {warm}:
+    queue.warm()
+t = time.perf_counter()
+queue._get_executor().submit(render_job, *{delivery!r}, {output!r}, 3).result()
+print(time.perf_counter() - t)
+queue.shutdown()
+"""
+
+
+def time_job(delivery, output, warm):
+    # Seconds from submit to a finished output for the first job on a new queue in a fresh interpreter
+    script = "import time\n" + JOB_SNIPPET.format(warm=warm, delivery=tuple(delivery), output=output)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(result.split()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark package import and render job start-up.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--points', type=int, default=30, help="trajectory points of the job delivery")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'stream_overlay_bench'),
+                        help="where generated inputs are kept between runs")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, code in IMPORT_SNIPPETS.items():
+        results[name] = statistics.median(time_snippet(code) for _ in range(args.repeat))
+
+    delivery = make_delivery(args.data_dir, 1280, 720, 30.0, args.points, 'predicted_path')
+    with tempfile.TemporaryDirectory() as work_dir:
+        for warm in (False, True):
+            output = os.path.join(work_dir, 'warm.avi' if warm else 'cold.avi')
+            runs = [time_job(delivery, output, warm) for _ in range(args.repeat)]
+            results["job_warm_pool" if warm else "job_cold_pool"] = statistics.median(runs)
+    results["job_spin_up"] = results["job_cold_pool"] - results["job_warm_pool"]
+
+    for name, seconds in results.items():
+        print(f"{name:<24} {seconds * 1000:9.1f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
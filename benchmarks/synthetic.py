@@ -0,0 +1,116 @@
+'''
+Synthetic deliveries for benchmarking: a video plus matching trajectory and
+decision JSON in every schema the renderers read. Everything is generated from
+a seed, so the same parameters always give the same files.
+'''
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+SCHEMAS = ('predicted_path', 'module4', 'xyz', 'tracker')
+
+
+def write_video(path, width, height, fps, frames, codec='MJPG'):
+    # Moving gradient with the frame number drawn on it, so every frame differs
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a {codec} writer for {path}")
+    x = np.arange(width, dtype=np.uint16)
+    y = np.arange(height, dtype=np.uint16)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame[..., 0] = (x + 3 * i) % 256
+        frame[..., 1] = (y + 2 * i) % 256
+        frame[..., 2] = ((x // 4 + y // 4 + i) % 256).astype(np.uint8)
+        cv2.putText(frame, str(i), (40, 80), cv2.FONT_HERSHEY_DUPLEX, 2, (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+
+def ball_path(width, height, points, seed=0):
+    '''
+    (points, 2) float pixel positions of a delivery: the ball drops from the top
+    of the frame to a bounce two thirds of the way through, then rises towards
+    the batter, with a pixel or two of tracking jitter. Also returns the bounce index.
+    '''
+    rng = np.random.default_rng(seed)
+    bounce = (2 * points) // 3
+    t = np.arange(points, dtype=np.float64)
+    x = width * (0.35 + 0.3 * t / max(points - 1, 1))
+    before = height * (0.1 + 0.75 * (t / max(bounce, 1)) ** 2)
+    after = height * (0.85 - 0.25 * (t - bounce) / max(points - 1 - bounce, 1)
+                      + 0.1 * ((t - bounce) / max(points - 1 - bounce, 1)) ** 2)
+    y = np.where(t <= bounce, before, after)
+    path = np.stack([x, y], axis=1) + rng.normal(0, 1.5, (points, 2))
+    return path, bounce
+
+
+def trajectory_document(schema, path, bounce, fps):
+    # JSON document for the trajectory in the given schema
+    points = [[round(float(px), 1), round(float(py), 1)] for px, py in path]
+    times = [round(i / fps, 6) for i in range(len(points))]
+    bounce_point = points[bounce] + [0.0]
+    impact_point = points[-1] + [0.5]
+    if schema == 'predicted_path':
+        return {"predicted_path": points}
+    if schema == 'module4':
+        return {
+            "previous_trajectory": [p + [float(i)] for i, p in enumerate(points)],
+            "predicted_trajectory": [[p[0] + 20.0 * (i + 1), p[1] - 10.0 * (i + 1), 0.0]
+                                     for i, p in enumerate([points[-1]] * 10)],
+            "bounce_point": bounce_point,
+            "leg_impact_location": impact_point,
+            "stump_impact_location": None,
+            "collision": {"spatial_detection": {"collision_point": None}}
+        }
+    if schema == 'xyz':
+        return {
+            "trajectory_analysis": {
+                "original_points": [{"x": p[0], "y": p[1], "z": 0.0, "t": t} for p, t in zip(points, times)],
+                "predicted_points": []
+            },
+            "bounce_analysis": {"pos_x": 0.0, "pos_y": 0.0, "pos_z": 0.0, "timestamp": times[bounce]},
+            "impact_analysis": {"stump_impact": {"will_hit": False}, "bat_collision": {"detected": False}}
+        }
+    if schema == 'tracker':
+        return [{"pos_x": p[0], "pos_y": p[1], "pos_z": 0.0, "timestamp": t, "frame": i}
+                for i, (p, t) in enumerate(zip(points, times))]
+    raise ValueError(f"Unknown schema {schema!r}, expected one of {SCHEMAS}")
+
+
+def decision_document(path, bounce):
+    return {
+        "BallPitch": "In-Line",
+        "BallPitchPoint": [round(float(v), 1) for v in path[bounce]],
+        "PadImpact": "In-Line",
+        "PadImpactPoint": [round(float(v), 1) for v in path[-1]],
+        "HittingStumps": True,
+        "HittingStumpsPoint": [round(float(v), 1) for v in path[-1]],
+        "Decision": "Out",
+        "Reason": "Synthetic delivery"
+    }
+
+
+def make_delivery(directory, width=1280, height=720, fps=30.0, points=60, schema='predicted_path',
+                  extra_frames=10, seed=0):
+    '''
+    Writes a delivery to directory (reusing files generated earlier with the
+    same parameters) and returns (video, module4_json, module5_json) paths.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    video = os.path.join(directory, f'video_{width}x{height}_{fps:g}fps_{points + extra_frames}.avi')
+    module4 = os.path.join(directory, f'trajectory_{schema}_{width}x{height}_{points}_{seed}.json')
+    module5 = os.path.join(directory, f'decision_{width}x{height}_{points}_{seed}.json')
+    if not os.path.exists(video):
+        write_video(video, width, height, fps, points + extra_frames)
+    path, bounce = ball_path(width, height, points, seed)
+    if not os.path.exists(module4):
+        with open(module4, 'w') as f:
+            json.dump(trajectory_document(schema, path, bounce, fps), f)
+    if not os.path.exists(module5):
+        with open(module5, 'w') as f:
+            json.dump(decision_document(path, bounce), f)
+    return video, module4, module5
@@ -12,4 +12,9 @@ setup(
         'numpy',
         'flask'
     ],
+    entry_points={
+        'console_scripts': [
+            'stream-overlay-batch=stream_overlay.cli:main'
+        ]
+    },
 )
\ No newline at end of file
@@ -1 +1,34 @@
-from .draw_trajectory_new import TrajectoryOverlayRenderer
\ No newline at end of file
+'''
+Trajectory and decision overlays for cricket replays.
+
+The public classes are imported on first use, so `import stream_overlay` (or a
+light submodule such as stream_overlay.cache) does not load OpenCV and NumPy
+until a renderer is actually needed.
+'''
+
+import importlib
+
+# public name -> submodule that defines it
+_EXPORTS = {
+    'TrajectoryOverlayRenderer': '.draw_trajectory_new',
+    'LiveOverlay': '.live',
+    'OutputSpec': '.outputs',
+    'RenderCache': '.cache',
+    'RenderJobQueue': '.jobs',
+    'warm_up': '.warmup',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
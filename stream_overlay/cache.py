@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    # Streams the file through sha256 so large videos are never held in memory
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def canonical_json(path):
+    # Same JSON content hashes the same regardless of key order or whitespace
+    with open(path, 'rb') as f:
+        data = json.load(f)
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+class RenderCache:
+    '''
+    Content-addressed store of rendered videos on local disk.
+
+    Keys cover the video bytes, the canonicalised module4/module5 JSON and the
+    render settings (slow factor and style), so identical replays map to the
+    same entry. Entries are written atomically (temp file + os.replace) and the
+    least recently used ones are evicted once the cache grows past max_bytes.
+    '''
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, extension='.avi'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def make_key(self, video_path, module4_json, module5_json, settings):
+        digest = hashlib.sha256()
+        for part in (hash_file(video_path), canonical_json(module4_json), canonical_json(module5_json),
+                     json.dumps(settings, sort_keys=True, separators=(',', ':'))):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key, copy_to=None):
+        # With copy_to, a hit is hardlinked (or copied) there before eviction can
+        # remove it, and copy_to is returned instead of the path inside the cache
+        path = self._path(key)
+        with self._lock:
+            try:
+                # bump the access time used for LRU eviction
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if copy_to is None:
+                return path
+            try:
+                os.link(path, copy_to)
+            except OSError:
+                shutil.copyfile(path, copy_to)
+        return copy_to
+
+    def put(self, key, source_path):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(source_path, 'rb') as src:
+                shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._evict(keep=path)
+        return path
+
+    def add(self, key, write):
+        # Like put, for entries written in place: write(path) must create the file atomically
+        path = self._path(key)
+        write(path)
+        self._evict(keep=path)
+        return path
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.extension):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self, keep=None):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,208 @@
+'''
+Batch renderer for a directory or manifest of deliveries.
+
+    stream-overlay-batch DELIVERIES --output-dir rendered/ --workers 8 --timeout 600
+
+DELIVERIES is either
+    - a directory, where each delivery is a video next to <name>_module4.json and
+      <name>_module5.json, or a subdirectory holding one video plus
+      module4_output.json and module5_output.json
+    - a JSON manifest: [{"video": ..., "module4": ..., "module5": ..., "name": optional}, ...]
+      with paths relative to the manifest
+
+Each delivery is rendered to <output-dir>/<name>.avi (.mp4 with --encoder ffmpeg) in a
+pool of worker processes.
+Outputs that already exist are skipped, so an interrupted run can be restarted
+with the same command; a render is only moved into place once it is complete.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .formats import BACKEND_FORMATS
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.mov', '.mkv')
+
+
+class Delivery:
+    def __init__(self, name, video, module4, module5):
+        self.name = name
+        self.video = video
+        self.module4 = module4
+        self.module5 = module5
+
+
+def _scan_directory(directory):
+    deliveries = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if entry.is_dir():
+            module4 = os.path.join(entry.path, 'module4_output.json')
+            module5 = os.path.join(entry.path, 'module5_output.json')
+            videos = sorted(name for name in os.listdir(entry.path) if name.lower().endswith(VIDEO_EXTENSIONS))
+            if len(videos) == 1 and os.path.isfile(module4) and os.path.isfile(module5):
+                deliveries.append(Delivery(entry.name, os.path.join(entry.path, videos[0]), module4, module5))
+            continue
+        stem, extension = os.path.splitext(entry.path)
+        if extension.lower() in VIDEO_EXTENSIONS:
+            module4, module5 = stem + '_module4.json', stem + '_module5.json'
+            if os.path.isfile(module4) and os.path.isfile(module5):
+                deliveries.append(Delivery(os.path.basename(stem), entry.path, module4, module5))
+    return deliveries
+
+
+def _read_manifest(path):
+    with open(path) as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    deliveries = []
+    for entry in entries:
+        video = os.path.join(base, entry['video'])
+        name = entry.get('name') or os.path.splitext(os.path.basename(video))[0]
+        deliveries.append(Delivery(name, video, os.path.join(base, entry['module4']),
+                                   os.path.join(base, entry['module5'])))
+    return deliveries
+
+
+def find_deliveries(source):
+    deliveries = _scan_directory(source) if os.path.isdir(source) else _read_manifest(source)
+    names = [delivery.name for delivery in deliveries]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Deliveries would overwrite each other's output: {', '.join(duplicates)}")
+    return deliveries
+
+
+def _init_worker():
+    # the pool already runs one delivery per core, so keep OpenCV from spawning threads of its own
+    import cv2
+
+    from .warmup import warm_up
+
+    cv2.setNumThreads(1)
+    warm_up()
+
+
+def render_delivery(delivery, output_path, render_options, timeout):
+    '''
+    Renders one delivery in a worker process and returns (frames, seconds).
+
+    The timeout is the renderer's deadline, checked between frames, so a
+    delivery that runs over stops cleanly instead of leaving a worker behind.
+    The video is written to a .partial file and only renamed to output_path
+    once it is complete.
+    '''
+    from .draw_trajectory_new import TrajectoryOverlayRenderer
+
+    started = time.monotonic()
+    stem, extension = os.path.splitext(output_path)
+    partial_path = stem + '.partial' + extension
+    try:
+        renderer = TrajectoryOverlayRenderer(
+            video_path=delivery.video,
+            module4_json=delivery.module4,
+            module5_json=delivery.module5,
+            output_path=partial_path,
+            deadline=started + timeout if timeout else None,
+            **render_options
+        )
+        metrics = renderer.run()
+    except TimeoutError as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise TimeoutError(f"Timed out after {timeout:g}s: {e}") from None
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, output_path)
+    return metrics["frames"], time.monotonic() - started
+
+
+def run_batch(deliveries, output_dir, workers=None, timeout=None, force=False, **render_options):
+    # Renders every delivery that has no output yet; render_options go to TrajectoryOverlayRenderer.
+    # Returns a summary dict
+    output_extension = BACKEND_FORMATS[render_options.get('backend', 'opencv')][0]
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {"rendered": 0, "skipped": 0, "failed": 0, "timed_out": 0, "frames": 0, "seconds": 0.0}
+    pending = []
+    for delivery in deliveries:
+        output_path = os.path.join(output_dir, delivery.name + output_extension)
+        if os.path.exists(output_path) and not force:
+            summary["skipped"] += 1
+        else:
+            pending.append((delivery, output_path))
+
+    started = time.monotonic()
+    total = len(pending)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(render_delivery, delivery, output_path, render_options, timeout): delivery
+            for delivery, output_path in pending
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            delivery = futures[future]
+            try:
+                frames, seconds = future.result()
+            except TimeoutError as e:
+                summary["timed_out"] += 1
+                print(f"[{done}/{total}] {delivery.name}: {e}", file=sys.stderr)
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"[{done}/{total}] {delivery.name}: failed: {e!r}", file=sys.stderr)
+            else:
+                summary["rendered"] += 1
+                summary["frames"] += frames
+                print(f"[{done}/{total}] {delivery.name}: {frames} frames in {seconds:.1f}s")
+    summary["seconds"] = time.monotonic() - started
+    return summary
+
+
+def format_summary(summary):
+    seconds = summary["seconds"]
+    fps = summary["frames"] / seconds if seconds else 0.0
+    per_minute = summary["rendered"] * 60 / seconds if seconds else 0.0
+    return (f"{summary['rendered']} rendered, {summary['skipped']} skipped, {summary['failed']} failed, "
+            f"{summary['timed_out']} timed out in {seconds:.1f}s "
+            f"({fps:.1f} frames/s, {per_minute:.1f} deliveries/min)")
+
+
+def main(argv=None):
+    from .draw_trajectory_new import SLOW_MODES
+
+    parser = argparse.ArgumentParser(prog='stream-overlay-batch',
+                                     description="Render trajectory overlays for a batch of deliveries.")
+    parser.add_argument('deliveries', help="directory of deliveries or a JSON manifest")
+    parser.add_argument('-o', '--output-dir', required=True, help="where the rendered videos are written")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--timeout', type=float, default=None, help="per-delivery time limit in seconds")
+    parser.add_argument('--slow-factor', type=int, default=3)
+    parser.add_argument('--slow-mode', choices=SLOW_MODES, default='fps')
+    parser.add_argument('--encoder', choices=('opencv', 'ffmpeg'), default='opencv',
+                        help="OpenCV XVID AVI, or H.264 MP4 through a local ffmpeg")
+    parser.add_argument('--codec', help="FourCC for opencv, encoder name for ffmpeg")
+    parser.add_argument('--preset', help="ffmpeg preset, e.g. ultrafast or slow")
+    parser.add_argument('--crf', type=int, help="ffmpeg constant rate factor")
+    parser.add_argument('--threads', type=int, help="ffmpeg encoder threads")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="split each delivery into this many shard processes (needs ffmpeg and ffprobe)")
+    parser.add_argument('--force', action='store_true', help="re-render deliveries that already have an output")
+    args = parser.parse_args(argv)
+    encoder = {name: getattr(args, name) for name in ('preset', 'crf', 'threads') if getattr(args, name) is not None}
+
+    deliveries = find_deliveries(args.deliveries)
+    if not deliveries:
+        parser.error(f"no deliveries found in {args.deliveries}")
+    summary = run_batch(deliveries, args.output_dir, workers=args.workers, timeout=args.timeout,
+                        force=args.force, slow_factor=args.slow_factor, slow_mode=args.slow_mode,
+                        backend=args.encoder, codec=args.codec, encoder=encoder, shards=args.shards)
+    print(format_summary(summary))
+    return 1 if summary["failed"] or summary["timed_out"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
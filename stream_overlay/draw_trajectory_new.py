@@ -1,210 +1,545 @@
+import copy
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
-import json
 import numpy as np
 
+from .cache import RenderCache
+from .hud import get_hud_sprite, hud_layout_signature
+from .layers import TrajectoryLayer
+from .loader import load_decision, load_trajectory
+from .metrics import StageProfiler, peak_rss_bytes
+from .outputs import OutputSink, OutputSpec
+from .pipeline import FramePipeline
+from .plan import RenderPlan, plan_key
+from .shards import concat_segments, keyframes, plan_shards, shard_count
+from .shared_frames import ProcessFramePipeline
+from .trajectory import SmoothPath, event_indices, point_frames
+
+# 'fps': every frame is encoded once and the output frame rate is divided by slow_factor
+# 'duplicate': every frame is encoded slow_factor times at the original frame rate
+SLOW_MODES = ('fps', 'duplicate')
+# events where the ball changes direction, so the interpolated path is fitted separately on either side
+SEGMENT_BREAK_EVENTS = ('pitch', 'bounce', 'pad_impact', 'leg_impact')
+# draft renders: output size relative to the source, and encoder settings that favour speed over size
+DRAFT_SCALE = 0.5
+DRAFT_ENCODERS = {'ffmpeg': {'preset': 'ultrafast', 'crf': 30}}
+# JPEG (MJPG) frames decode straight to 1/2, 1/4 or 1/8 of their size
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# size the plan cache is trimmed to, least recently used plans first (a plan is a few KB)
+PLAN_CACHE_BYTES = 64 * 1024 ** 2
+
 class TrajectoryOverlayRenderer:
-    def __init__(self, video_path, module4_json, module5_json, output_path, slow_factor=3):
+    # ---------------- style ----------------
+    trajectory_color = (255, 0, 0)
+    trajectory_thickness = 14
+    ball_dot_radius = 6
+    bounce_color = (0, 255, 255)
+    impact_color = (0, 0, 255)
+    marker_radius = 7
+    overlay_alpha = 0.3
+    # events that get a marker once the ball reaches them, with the style attribute holding their colour
+    marker_events = (("pitch", "bounce_color"), ("pad_impact", "impact_color"))
+    top_box_color = (255, 0, 0)
+    bottom_box_color_out = (0, 0, 255)
+    bottom_box_color_not_out = (0, 255, 0)
+
+    STYLE_ATTRIBUTES = ('trajectory_color', 'trajectory_thickness', 'ball_dot_radius', 'bounce_color',
+                        'impact_color', 'marker_radius', 'overlay_alpha', 'marker_events')
+
+    def __init__(self, video_path, module4_json, module5_json, output_path, slow_factor=3, slow_mode='fps',
+                 workers=0, queue_depth=8, outputs=None, start_frame=None, start_time=None,
+                 pre_roll=0.0, post_roll=0.0, interpolate=False, profile=False, processes=0,
+                 backend='opencv', codec=None, encoder=None, shards=0, plan_cache=None, draft=False,
+                 draft_scale=DRAFT_SCALE, deadline=None, plan_cache_bytes=PLAN_CACHE_BYTES):
+        if slow_mode not in SLOW_MODES:
+            raise ValueError(f"slow_mode must be one of {SLOW_MODES}, got {slow_mode!r}")
+        if start_frame is not None and start_time is not None:
+            raise ValueError("Pass either start_frame or start_time, not both")
+        if draft and outputs:
+            raise ValueError("Draft renders only write output_path")
         self.video_path = video_path
         self.module4_json = module4_json
         self.module5_json = module5_json
         self.output_path = output_path
         self.slow_factor = slow_factor
-        self._load_data()
+        self.slow_mode = slow_mode
+        self.workers = workers  # 0 renders on the calling thread, otherwise render threads in a pipeline
+        self.queue_depth = queue_depth
+        # render processes fed through shared memory; takes precedence over workers
+        self.processes = processes
+        # independent processes that each decode, render and encode one stretch of the
+        # video, joined afterwards; takes precedence over processes and workers. At most one
+        # per core, and none without ffmpeg and ffprobe to split and join the stretches
+        self.shards = shard_count(shards)
+        self.outputs = list(outputs or [])  # extra OutputSpecs rendered from the same decode
+        # writer for output_path, as in OutputSpec: 'opencv' (XVID by default) or 'ffmpeg' (libx264)
+        self.backend = backend
+        self.codec = codec
+        self.encoder = DRAFT_ENCODERS.get(backend) if draft and encoder is None else encoder
+        # quick preview: rendered at draft_scale of the source size, at the source frame rate
+        # (no slow motion) and with the fastest encoder settings
+        self.draft = draft
+        self.scale = draft_scale if draft else 1.0
+        # where the delivery starts in the input video, and seconds of video kept around it
+        self.start_frame = start_frame
+        self.start_time = start_time
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        # draw slow_factor distinct frames per input frame along a fitted path instead of repeating it
+        self.interpolate = interpolate
+        self.subframes = int(slow_factor) if interpolate and not draft else 1
+        # per-stage timings in the metrics returned by run(); off by default since it wraps every stage
+        self.profiler = StageProfiler() if profile else None
+        # directory of compiled render plans, so re-rendering the same inputs skips loading and planning,
+        # kept to plan_cache_bytes like the render cache
+        self.plan_cache = plan_cache
+        self.plan_cache_bytes = plan_cache_bytes
+        # time.monotonic() past which writing another frame raises TimeoutError, whichever
+        # way the render runs (shard processes included)
+        self.deadline = deadline
+        self.metrics = None
         self._setup_video()
 
     def _load_data(self):
-        with open(self.module4_json, 'r') as f4:
-            data4 = json.load(f4)
-
-        with open(self.module5_json, 'r') as f5:
-            data5 = json.load(f5)
-
-        self.trajectory = [{"x": int(p[0]), "y": int(p[1])} for p in data4["predicted_path"]]
-
-        ball_pitch_point = data5.get("BallPitchPoint")
-        pad_impact_point = data5.get("PadImpactPoint")
-
-        self.bounce_point = {"x": int(ball_pitch_point[0]), "y": int(ball_pitch_point[1])} if ball_pitch_point else None
-        self.impact_point = {"x": int(pad_impact_point[0]), "y": int(pad_impact_point[1])} if pad_impact_point else None
-
-        self.pitching_result = data5.get("BallPitch", "N/A")
-        self.impact_result = data5.get("PadImpact", "N/A")
-        self.wickets_result = "Hitting" if data5.get("HittingStumps", False) else "Missing"
-        self.final_decision = data5.get("Decision", "N/A")
-
-        self.trajectory_color = (255, 0, 0)
-        self.trajectory_thickness = 14
-        self.ball_dot_radius = 6
-        self.bounce_color = (0, 255, 255)
-        self.impact_color = (0, 0, 255)
-        self.marker_radius = 7
-        self.top_box_color = (255, 0, 0)
-        self.bottom_box_color_out = (0, 0, 255)
-        self.bottom_box_color_not_out = (0, 255, 0)
-
-        self.bounce_index = self._find_closest_index(self.bounce_point) if self.bounce_point else -1
-        self.impact_index = self._find_closest_index(self.impact_point) if self.impact_point else -1
-
-    def _find_closest_index(self, target_point):
-        min_dist = float('inf')
-        min_idx = -1
-        for i, pt in enumerate(self.trajectory):
-            dist = (pt['x'] - target_point['x'])**2 + (pt['y'] - target_point['y'])**2
-            if dist < min_dist:
-                min_dist = dist
-                min_idx = i
-        return min_idx
+        trajectory = load_trajectory(self.module4_json)
+        decision = load_decision(self.module5_json)
+
+        # (N, 2) int32 points, plus the same points as tuples for OpenCV's drawing calls
+        self.trajectory = trajectory.path
+        self.trajectory_points = [tuple(p) for p in self.trajectory.tolist()]
+        self.timestamps = trajectory.timestamps
+        self.labelled_frames = trajectory.frames
+
+        self.pitching_result = decision.pitching_result
+        self.impact_result = decision.impact_result
+        self.wickets_result = "Hitting" if decision.hitting_stumps else "Missing"
+        self.final_decision = decision.final_decision
+
+        # every event is mapped to its closest trajectory point once, in one batched lookup
+        self.events = {**trajectory.events, **decision.events}
+        self.event_indices = event_indices(self.trajectory, self.events)
+        self.markers = [
+            (tuple(self.events[name].tolist()), getattr(self, color_attribute), self.event_indices[name])
+            for name, color_attribute in self.marker_events if name in self.events
+        ]
+        self.bounce_index = self.event_indices.get("pitch", -1)
+        self.impact_index = self.event_indices.get("pad_impact", -1)
+
+    @classmethod
+    def style_signature(cls):
+        # Everything about the look of the output that is not in the input files
+        style = {name: getattr(cls, name) for name in cls.STYLE_ATTRIBUTES}
+        style['hud'] = hud_layout_signature()
+        return style
 
     def _setup_video(self):
         self.cap = cv2.VideoCapture(self.video_path)
-        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video {self.video_path}")
+        # frames are rendered at this size; only draft renders differ from the source
+        self.width = round(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH) * self.scale)
+        self.height = round(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * self.scale)
         self.original_fps = self.cap.get(cv2.CAP_PROP_FPS)
-        self.fps = self.original_fps
-        self.out = cv2.VideoWriter(
-            self.output_path,
-            cv2.VideoWriter_fourcc(*'XVID'),
-            self.fps,
-            (self.width, self.height)
-        )
+        self._reduced_decode = None
+        reduction = round(1 / self.scale)
+        fourcc = (int(self.cap.get(cv2.CAP_PROP_FOURCC)) & 0xFFFFFFFF).to_bytes(4, 'little').decode(errors='replace')
+        if reduction in REDUCED_DECODE_FLAGS and reduction * self.scale == 1 and fourcc.upper() == 'MJPG':
+            self._reduced_decode = REDUCED_DECODE_FLAGS[reduction]
+        self._open_capture()
+        self.fps, self.repeat = self._output_timing(self.slow_factor)
+        self.plan = self._get_plan()
+        self.first_frame = self.plan.first_frame
+        self.frame_stop = self.plan.frames  # output frames past this are not rendered
+
+        # output_path is written as the source-sized output; frames are only available
+        # through iter_frames when there are no outputs at all
+        self.specs = self.outputs
+        if self.output_path is not None:
+            self.specs = [OutputSpec(self.output_path, codec=self.codec, backend=self.backend,
+                                     encoder=self.encoder)] + self.specs
+        if self.shards > 1 and not self.specs:
+            raise ValueError("Sharded rendering needs an output_path or outputs to write")
+        # sharded renders open their writers in the shard processes
+        self._open_sinks([] if self.shards > 1 else self.specs)
         self.frame_idx = 0
-    
-    def draw_gradient_box(self, frame, x, y, width, height, color_top, color_bottom):
-        for i in range(height):
-            # Calculate interpolation factor
-            alpha = i / height
-            # Interpolate between top and bottom colors
-            color = [
-                int((1 - alpha) * color_top[j] + alpha * color_bottom[j])
-                for j in range(3)
-            ]
-            # Draw a 1-pixel-high line with the interpolated color
-            cv2.line(frame, (x, y + i), (x + width, y + i), color, 1)
-
-    
-    
-    
-    
-    
-    def draw_decision_boxes(self, frame):
-        # Draws the decision boxes on the screen
-        font = cv2.FONT_HERSHEY_DUPLEX
-        label_font_scale = 0.6
-        value_font_scale = 0.6
-        thickness = 1
-
-
-        # labels: all the decision boxes we'll get on the screen
-        labels = ["PITCHING", "IMPACT", "WICKETS", "FINAL DECISION"]
-        
-        # the values recieved for each of these boxes 
-        values = [
+        self.write_idx = 0
+        self._source_frame = None
+        self._decoded = None
+        self._seek(self.first_frame)
+        if self.profiler is not None:
+            self._instrument()
+
+    def _open_sinks(self, specs):
+        self.sinks = [OutputSink(spec, (self.width, self.height), *self._output_timing(spec.slow_factor or self.slow_factor))
+                      for spec in specs]
+        self.out = self.sinks[0].writer if self.sinks and self.output_path is not None else None
+
+        # a sink that keeps the source frame as it is can draw its HUD on the shared frame,
+        # as long as it is the last one to see it
+        self.sinks.sort(key=lambda sink: sink.passthrough and sink.spec.hud)
+        if self.sinks and self.sinks[-1].passthrough:
+            self.sinks[-1].in_place = True
+        # with a single full-size output (or none) the HUD is drawn as part of rendering the frame
+        self.hud_on_render = not self.sinks or (
+            len(self.sinks) == 1 and self.sinks[0].in_place and self.sinks[0].spec.hud and self.sinks[0].hud_scale == 1.0)
+
+    def _open_capture(self):
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.video_path)
+        if self._reduced_decode is not None:
+            # hand out the undecoded JPEG of each frame, for _decode to decode at the reduced size
+            self.cap.set(cv2.CAP_PROP_FORMAT, -1)
+
+    # state that stays in the parent process when the renderer is sent to render processes
+    PARENT_ONLY = ('cap', 'out', 'sinks', '_source_frame', '_decoded', 'profiler',
+                   '_read_frame', 'render_frame', 'draw_decision_boxes', '_write_frame')
+
+    def __getstate__(self):
+        # Render processes only need what render_frame reads: the points, markers and results
+        state = {name: value for name, value in self.__dict__.items() if name not in self.PARENT_ONLY}
+        state['profiler'] = None
+        return state
+
+    def _instrument(self):
+        # Shadows the stage methods with timed wrappers on this instance only
+        self._read_frame = self.profiler.wrap('decode', self._read_frame)
+        self.render_frame = self.profiler.wrap('render', self.render_frame)
+        self.draw_decision_boxes = self.profiler.wrap('hud', self.draw_decision_boxes)
+        self._write_frame = self.profiler.wrap('encode', self._write_frame)
+
+    def _plan_settings(self):
+        # Everything besides the two input files that goes into the plan
+        return {
+            "fps": self.original_fps,
+            "start_frame": self.start_frame,
+            "start_time": self.start_time,
+            "pre_roll": self.pre_roll,
+            "post_roll": self.post_roll,
+            "subframes": self.subframes,
+            "scale": self.scale,
+            "style": self.style_signature()
+        }
+
+    def _get_plan(self):
+        # The compiled plan for these inputs, from plan_cache when it has one
+        if self.plan_cache is None:
+            return self.compile_plan()
+        key = plan_key(self.module4_json, self.module5_json, self._plan_settings())
+        try:
+            cache = RenderCache(self.plan_cache, max_bytes=self.plan_cache_bytes, extension='.npz')
+            path = cache.get(key)
+        except OSError:
+            cache = path = None
+        if path is not None:
+            try:
+                return RenderPlan.load(path)
+            except (OSError, ValueError, KeyError):
+                pass  # unreadable or from another plan version: compiled again below
+        plan = self.compile_plan()
+        if cache is not None:
+            try:
+                cache.add(key, plan.save)
+            except OSError:
+                pass  # a failed cache write must not fail the render
+        return plan
+
+    def compile_plan(self):
+        # Loads the inputs and decides once what every output frame shows, in output pixels
+        self._load_data()
+        self._plan_window()
+        scale = self.scale
+        frame_points = np.asarray(self.frame_points, dtype=np.int32)
+        markers = np.zeros(len(frame_points), dtype=np.int64)
+        for bit, (_, _, index) in enumerate(self.markers):
+            markers |= (frame_points >= index).astype(np.int64) << bit
+        values = (
             self.pitching_result.upper(),
             self.impact_result.upper(),
             self.wickets_result.upper(),
             self.final_decision.upper()
-        ]
-
-        value_colors = {
-            "OUT": (0, 0, 255),             # Red
-            "NOT OUT": (26, 158, 26),       # Green
-            "HITTING": (0, 0, 255),         # Red
-            "MISSING": (0, 0, 255),         # Red
-            "IN-LINE": (26, 158, 26),       # Green
-            "INLINE": (18, 118, 18),        # Green
-            "OUTSIDE OFF": (0, 0, 255),     # Red
-            "OUTSIDE LEG": (0, 0, 255),     # Red
-            "N/A": (128, 128, 128)          # Grey
-        }
-
-        box_width = 180
-        box_height = 30
-        spacing = 12
-
-        # Horizontal position of the boxes
-        frame_width = frame.shape[1]  # Get the width of the video frame
-        start_x = frame_width - box_width - 50  # 50 px right margin
-
-        # vertical position of the boxes
-        start_y = frame.shape[0] // 5       
-
-
-
-
-        for i in range(len(labels)):
-            y = start_y + i * (box_height * 2 + spacing)
-
-            # ------------ Draw gradient label box (top to bottom blue fade)--------------------
-            self.draw_gradient_box(frame, start_x, y, box_width, box_height,
-                          color_top=(195, 47, 47), color_bottom=(84, 18, 18))
-            
-            # --------------Add Label text---------------------
-            label_text = labels[i]
-            label_size = cv2.getTextSize(label_text, font, label_font_scale, thickness)[0]
-            label_x = start_x + (box_width - label_size[0]) // 2
-            label_y = y + (box_height + label_size[1]) // 2 -2 
-            cv2.putText(frame, label_text, (label_x, label_y), font, label_font_scale,
-                        (255, 255, 255), thickness, cv2.LINE_AA)
-
-            # --------------Draw Solid color value box below-----------------------
-            y_val = y + box_height
-            value = values[i]
-            color = value_colors.get(value, (100, 100, 100))
-            cv2.rectangle(frame, (start_x, y_val), (start_x + box_width, y_val + box_height), color, -1)
+        )
+        return RenderPlan(
+            self.first_frame,
+            paths=[(np.rint(np.reshape(self.draw_points, (-1, 2)) * scale), self.trajectory_color,
+                    max(1, round(self.trajectory_thickness * scale)))],
+            segments=frame_points,
+            source=np.arange(len(frame_points)) // self.subframes,
+            ball=frame_points,
+            ball_style=(max(1, round(self.ball_dot_radius * scale)), self.trajectory_color),
+            markers=markers,
+            marker_circles=[(tuple(round(v * scale) for v in point), max(1, round(self.marker_radius * scale)), color)
+                            for point, color, _ in self.markers],
+            hud=np.zeros(len(frame_points)),
+            huds=[(values, cv2.LINE_AA)],
+            alpha=self.overlay_alpha
+        )
 
-            # --------------Add Value text-------------------------------
-            value_size = cv2.getTextSize(value, font, value_font_scale, thickness)[0]
-            value_x = start_x + (box_width - value_size[0]) // 2
-            value_y = y_val + (box_height + value_size[1]) // 2 -2 
-            cv2.putText(frame, value, (value_x, value_y), font, value_font_scale,
-                        (255, 255, 255), thickness, cv2.LINE_AA)
-            
+    def _plan_window(self):
+        # Works out which input frames to decode and which trajectory point each one shows
+        fps = self.original_fps
+        if self.start_frame is not None:
+            start_frame = self.start_frame
+        elif self.start_time is not None and fps > 0:
+            start_frame = round(self.start_time * fps)
+        else:
+            start_frame = None  # where the points were labelled, or from the start of the video
+        self.point_frames = point_frames(len(self.trajectory), self.timestamps, fps, start_frame,
+                                         frames=self.labelled_frames)
+        # the points the path is drawn through; frame_points index into this
+        self.draw_points = self.trajectory_points
+        if len(self.point_frames) == 0:
+            self.first_frame = start_frame or 0
+            self.frame_points = []
+            return
+        self.first_frame = max(0, int(self.point_frames[0]) - round(self.pre_roll * fps))
+        last_frame = int(self.point_frames[-1]) + round(self.post_roll * fps)
+        if self.subframes > 1:
+            self._plan_subframes(last_frame)
+            return
+        # the last point at or before each frame; -1 for pre-roll frames before the delivery
+        window = np.arange(self.first_frame, last_frame + 1)
+        self.frame_points = (np.searchsorted(self.point_frames, window, side='right') - 1).tolist()
+
+    def _plan_subframes(self, last_frame):
+        # Precomputes the ball position for every output frame from a piecewise parabola
+        # through the tracked points, split where the ball bounces or hits the pad
+        times = self.first_frame + np.arange((last_frame - self.first_frame + 1) * self.subframes) / self.subframes
+        breaks = [self.event_indices[name] for name in SEGMENT_BREAK_EVENTS if name in self.event_indices]
+        path = SmoothPath(self.point_frames, self.trajectory, breaks=breaks)
+        started = times >= self.point_frames[0]
+        curve_times = times[started]
+        self.draw_points = [tuple(p) for p in np.rint(path(curve_times)).astype(np.int32).tolist()]
+        first = len(times) - len(curve_times)
+        self.frame_points = np.where(started, np.arange(len(times)) - first, -1).tolist()
+        # markers appear on the first output frame at or after their point's time
+        self.markers = [
+            (point, color, int(np.searchsorted(curve_times, self.point_frames[index])))
+            for point, color, index in self.markers
+        ]
 
+    def _seek(self, frame_number):
+        # The backend seeks to the keyframe before frame_number and decodes forward from
+        # there; inputs that cannot seek (e.g. a pipe) skip frames without retrieving them
+        if frame_number <= 0:
+            return
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        for _ in range(frame_number - position):
+            if not self.cap.grab():
+                break
 
+    def _output_timing(self, slow_factor):
+        # (fps, repeat) for an output slowed down by slow_factor
+        if self.draft:
+            return self.original_fps, 1
+        if self.interpolate:
+            # subframes distinct frames are written for every input frame
+            return self.original_fps * self.subframes / slow_factor, 1
+        if self.slow_mode == 'fps':
+            # same duration as writing each frame slow_factor times, for 1/slow_factor of the encode work
+            return self.original_fps / slow_factor, 1
+        return self.original_fps, slow_factor
+
+    def draw_decision_boxes(self, frame, index=0, scale=1.0):
+        # Draws the decision boxes the plan shows on output frame index, from a sprite rendered once per decision
+        hud = self.plan.hud[index]
+        if hud < 0:
+            return frame
+        values, line_type = self.plan.huds[hud]
+        sprite = get_hud_sprite((frame.shape[1], frame.shape[0]), values, line_type, scale * self.scale)
+        return sprite.blit(frame)
+
+    def render_frame(self, frame, frame_idx, layer):
+        # Draws the overlay for frame_idx (counted from the first decoded frame) onto frame
+        # in place, as the plan says. A layer only moves forward, so each layer has to be given
+        # increasing frame indices; a new layer can start at any frame, it draws the path up to there first
+        blended_frame = self.plan.draw(frame, frame_idx, layer)
+        if not self.hud_on_render:
+            # each output draws the HUD at its own size in _write_frame
+            return blended_frame
+        return self.draw_decision_boxes(blended_frame, frame_idx)
+
+    def _new_layer(self):
+        # the trajectory layer persists across frames and gets one new segment per frame
+        layer = TrajectoryLayer(self.width, self.height)
+        if self.profiler is not None:
+            layer.draw_path_to = self.profiler.wrap('trajectory', layer.draw_path_to)
+            layer.composite = self.profiler.wrap('blend', layer.composite)
+        return layer
+
+    def _decode(self, buffer):
+        # Decodes the next input frame at the render size, into buffer where possible; None at the end
+        if self.scale == 1.0:
+            ret, frame = self.cap.read(buffer)
+            return frame if ret else None
+        if self._reduced_decode is not None:
+            ret, packet = self.cap.read()
+            frame = cv2.imdecode(packet, self._reduced_decode) if ret else None
+        else:
+            ret, self._decoded = self.cap.read(self._decoded)
+            frame = self._decoded if ret else None
+        if frame is None or frame.shape[:2] == (self.height, self.width):
+            return frame
+        return cv2.resize(frame, (self.width, self.height), dst=buffer, interpolation=cv2.INTER_AREA)
+
+    def _read_frame(self, buffer):
+        # decode into a recycled buffer instead of allocating a new one
+        if self.frame_idx >= self.frame_stop or not self.cap.isOpened():
+            return None
+        if not self.plan.reuses_source:
+            frame = self._decode(buffer)
+            if frame is None:
+                return None
+        else:
+            # each decoded frame backs several output frames, so it is kept untouched and copied
+            if self.plan.decode[self.frame_idx] or self._source_frame is None:
+                self._source_frame = self._decode(self._source_frame)
+                if self._source_frame is None:
+                    return None
+            if buffer is None:
+                buffer = np.empty_like(self._source_frame)
+            np.copyto(buffer, self._source_frame)
+            frame = buffer
+        self.frame_idx += 1
         return frame
 
-    
+    def _write_frame(self, frame):
+        # Fans the rendered frame out to every output, cropping, resizing and adding the HUD per output.
+        # Frames arrive in order, so the plan row is tracked here rather than passed in
+        index = self.write_idx
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise TimeoutError(f"Deadline passed at output frame {index}")
+        hold = int(self.plan.holds[index])
+        self.write_idx += 1
+        for sink in self.sinks:
+            output_frame = sink.prepare(frame)
+            if sink.spec.hud and not self.hud_on_render:
+                output_frame = self.draw_decision_boxes(output_frame, index, sink.hud_scale)
+            sink.write(output_frame, hold)
+
+    def release_outputs(self):
+        for sink in self.sinks:
+            sink.release()
+
+    def iter_frames(self):
+        # Yields each distinct rendered frame once, in order. The frame buffer is
+        # reused for the next frame, so consume (or copy) it before advancing.
+        # With extra outputs the HUD is added per output, so these frames have none.
+        layer = self._new_layer()
+        frame = None
+        try:
+            while True:
+                frame = self._read_frame(frame)
+                if frame is None:
+                    break
+                yield self.render_frame(frame, self.frame_idx - 1, layer)
+        finally:
+            self.cap.release()
+
+    def _render_shard(self, start, stop, paths, profile):
+        # Runs in a shard process: renders output frames [start, stop) into one
+        # segment per output spec, with its own capture, layer and writers
+        self.cap = None
+        self._open_capture()
+        self.frame_stop = stop
+        self.frame_idx = self.write_idx = start
+        self._source_frame = self._decoded = None
+        specs = [copy.copy(spec) for spec in self.specs]
+        for spec, path in zip(specs, paths):
+            spec.path = path
+        self._open_sinks(specs)
+        if start < stop:
+            self._seek(self.first_frame + int(self.plan.source[start]))
+        if profile:
+            self.profiler = StageProfiler()
+            self._instrument()
+        try:
+            for frame in self.iter_frames():
+                self._write_frame(frame)
+        finally:
+            self.release_outputs()
+        return self.frame_idx - start, self.profiler.samples if profile else None
+
+    def _render_sharded(self):
+        # Splits the window at keyframes, renders the shards in parallel and joins each output's segments
+        self.cap.release()
+        ranges = plan_shards(self.first_frame, self.plan.source_frames, self.shards, keyframes(self.video_path))
+        work_dir = tempfile.mkdtemp(prefix='stream_overlay_shards_',
+                                    dir=os.path.dirname(os.path.abspath(self.specs[0].path)))
+        try:
+            segments = [[os.path.join(work_dir, f'{shard}_{i}{os.path.splitext(spec.path)[1]}')
+                         for i, spec in enumerate(self.specs)] for shard in range(len(ranges))]
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(self._render_shard,
+                                    *self.plan.output_range(start - self.first_frame, stop - self.first_frame),
+                                    paths, self.profiler is not None)
+                    for (start, stop), paths in zip(ranges, segments)
+                ]
+                results = [future.result() for future in futures]
+            for samples in (samples for _, samples in results if samples):
+                for stage, values in samples.items():
+                    self.profiler.samples.setdefault(stage, []).extend(values)
+            for i, spec in enumerate(self.specs):
+                # shards past the end of a short video write nothing
+                written = [paths[i] for paths, (frames, _) in zip(segments, results) if frames] or [segments[0][i]]
+                concat_segments(written, spec.path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        self.frame_idx = sum(frames for frames, _ in results)
 
     def draw_overlay(self):
-        while self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret or self.frame_idx >= len(self.trajectory):
-                break
-
-            overlay = frame.copy()
-            point = self.trajectory[self.frame_idx]
-            current_pos = (point['x'], point['y'])
-
-            for i in range(1, self.frame_idx + 1):
-                pt1 = (self.trajectory[i - 1]['x'], self.trajectory[i - 1]['y'])
-                pt2 = (self.trajectory[i]['x'], self.trajectory[i]['y'])
-                cv2.line(overlay, pt1, pt2, self.trajectory_color, self.trajectory_thickness)
-
-            cv2.circle(overlay, current_pos, self.ball_dot_radius, self.trajectory_color, -1)
-
-            if self.bounce_point and self.frame_idx >= self.bounce_index:
-                cv2.circle(overlay, (self.bounce_point['x'], self.bounce_point['y']),
-                           self.marker_radius, self.bounce_color, -1)
-
-            if self.impact_point and self.frame_idx >= self.impact_index:
-                cv2.circle(overlay, (self.impact_point['x'], self.impact_point['y']),
-                           self.marker_radius, self.impact_color, -1)
-
-            alpha = 0.3
-            blended_frame = cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0)
-            frame_with_boxes = self.draw_decision_boxes(blended_frame)
-
-            for _ in range(self.slow_factor):
-                self.out.write(frame_with_boxes)
-
-            self.frame_idx += 1
-
-        self.cap.release()
-        self.out.release()
-        print(f"Output video saved as {self.output_path}")
+        started = time.perf_counter()
+        try:
+            if self.shards > 1:
+                self._render_sharded()
+            elif self.processes > 0:
+                # bound through the class so profiling wrappers on this instance are not sent along
+                pipeline = ProcessFramePipeline(self._read_frame, type(self).render_frame.__get__(self),
+                                                self._write_frame, (self.height, self.width, 3),
+                                                make_state=self._new_layer, workers=self.processes,
+                                                queue_depth=self.queue_depth)
+                pipeline.run()
+            elif self.workers > 0:
+                pipeline = FramePipeline(self._read_frame, self.render_frame, self._write_frame,
+                                         make_state=self._new_layer, workers=self.workers,
+                                         queue_depth=self.queue_depth)
+                pipeline.run()
+            else:
+                for frame in self.iter_frames():
+                    self._write_frame(frame)
+        finally:
+            # also on errors (or a passed deadline), so a partly written output can be removed
+            self.cap.release()
+            self.release_outputs()
+        for spec in self.specs:
+            print(f"Output video saved as {spec.path}")
+        self.metrics = self._collect_metrics(time.perf_counter() - started)
+        return self.metrics
+
+    def _collect_metrics(self, seconds):
+        outputs = {spec.path: os.path.getsize(spec.path) if os.path.exists(spec.path) else 0
+                   for spec in self.specs}
+        metrics = {
+            "frames": self.frame_idx,
+            "seconds": round(seconds, 6),
+            "fps": round(self.frame_idx / seconds, 3) if seconds else None,
+            "bytes_written": sum(outputs.values()),
+            "outputs": outputs,
+            "peak_rss_bytes": peak_rss_bytes()
+        }
+        if self.profiler is not None:
+            metrics["stages"] = self.profiler.summary()
+        return metrics
 
     def run(self):
-        self.draw_overlay()
+        # Renders the video and returns the metrics of the run
+        return self.draw_overlay()
 
 
 # if __name__ == "__main__":
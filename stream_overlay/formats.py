@@ -0,0 +1,8 @@
+# Kept apart from .outputs so the app and the job queue can name formats without importing OpenCV
+
+# container extension and MIME type of the files each writer backend produces by default
+BACKEND_FORMATS = {
+    'opencv': ('.avi', 'video/x-msvideo'),
+    'ffmpeg': ('.mp4', 'video/mp4')
+}
+DEFAULT_CODECS = {'opencv': 'XVID', 'ffmpeg': 'libx264'}
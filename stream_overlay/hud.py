@@ -0,0 +1,157 @@
+import functools
+
+import cv2
+import numpy as np
+
+# labels: all the decision boxes we'll get on the screen
+LABELS = ("PITCHING", "IMPACT", "WICKETS", "FINAL DECISION")
+
+VALUE_COLORS = {
+    "OUT": (0, 0, 255),             # Red
+    "NOT OUT": (26, 158, 26),       # Green
+    "HITTING": (0, 0, 255),         # Red
+    "MISSING": (0, 0, 255),         # Red
+    "IN-LINE": (26, 158, 26),       # Green
+    "INLINE": (18, 118, 18),        # Green
+    "OUTSIDE OFF": (0, 0, 255),     # Red
+    "OUTSIDE LEG": (0, 0, 255),     # Red
+    "N/A": (128, 128, 128)          # Grey
+}
+DEFAULT_VALUE_COLOR = (100, 100, 100)
+
+FONT = cv2.FONT_HERSHEY_DUPLEX
+LABEL_FONT_SCALE = 0.6
+VALUE_FONT_SCALE = 0.6
+TEXT_THICKNESS = 1
+TEXT_COLOR = (255, 255, 255)
+
+BOX_WIDTH = 180
+BOX_HEIGHT = 30
+SPACING = 12
+RIGHT_MARGIN = 50
+LABEL_COLOR_TOP = (195, 47, 47)
+LABEL_COLOR_BOTTOM = (84, 18, 18)
+
+# the same handful of decisions repeat across renders, so a small cache covers them
+HUD_CACHE_SIZE = 64
+
+
+def draw_gradient_box(frame, x, y, width, height, color_top, color_bottom):
+    # Same colours as drawing one 1-pixel cv2.line per row, filled in a single slice assignment
+    alpha = np.arange(height)[:, None] / height
+    colors = ((1 - alpha) * np.array(color_top) + alpha * np.array(color_bottom)).astype(np.uint8)
+    y0, y1 = max(y, 0), min(y + height, frame.shape[0])
+    x0, x1 = max(x, 0), min(x + width + 1, frame.shape[1])
+    if y0 < y1 and x0 < x1:
+        frame[y0:y1, x0:x1, :3] = colors[y0 - y:y1 - y, None, :]
+
+
+def hud_layout_signature():
+    # Every constant that changes how the decision boxes look
+    return {
+        "labels": LABELS,
+        "value_colors": VALUE_COLORS,
+        "default_value_color": DEFAULT_VALUE_COLOR,
+        "font": (FONT, LABEL_FONT_SCALE, VALUE_FONT_SCALE, TEXT_THICKNESS, TEXT_COLOR),
+        "box": (BOX_WIDTH, BOX_HEIGHT, SPACING, RIGHT_MARGIN, LABEL_COLOR_TOP, LABEL_COLOR_BOTTOM)
+    }
+
+
+class HudSprite:
+    '''
+    Pre-rendered decision boxes for one frame size and set of values.
+
+    `pixels` is BGRA. Box pixels are fully opaque; only text that spills outside
+    its box carries partial (anti-aliased) alpha, in which case `blit` blends.
+    '''
+
+    def __init__(self, x, y, pixels):
+        self.x = x
+        self.y = y
+        self.pixels = pixels
+        self.opaque = pixels[..., 3:] == 255
+        self.partial = bool(np.any((pixels[..., 3] > 0) & (pixels[..., 3] < 255)))
+
+    def blit(self, frame):
+        height, width = self.pixels.shape[:2]
+        fx0, fy0 = max(self.x, 0), max(self.y, 0)
+        fx1 = min(self.x + width, frame.shape[1])
+        fy1 = min(self.y + height, frame.shape[0])
+        if fx0 >= fx1 or fy0 >= fy1:
+            return frame
+
+        roi = frame[fy0:fy1, fx0:fx1]
+        sprite = self.pixels[fy0 - self.y:fy1 - self.y, fx0 - self.x:fx1 - self.x]
+        if self.partial:
+            alpha = sprite[..., 3:].astype(np.uint16)
+            blended = (sprite[..., :3] * alpha + roi * (255 - alpha) + 127) // 255
+            roi[...] = blended.astype(np.uint8)
+        else:
+            np.copyto(roi, sprite[..., :3],
+                      where=self.opaque[fy0 - self.y:fy1 - self.y, fx0 - self.x:fx1 - self.x])
+        return frame
+
+
+def _text_layout(text, font_scale, thickness, box_x, box_y, box_width, box_height, offset):
+    size, baseline = cv2.getTextSize(text, FONT, font_scale, thickness)
+    x = box_x + (box_width - size[0]) // 2
+    y = box_y + (box_height + size[1]) // 2 - offset
+    # generous ink bounds (anti-aliasing can reach a couple of pixels past the text box)
+    return (x, y), (x - 2, y - size[1] - 2, x + size[0] + 3, y + baseline + 3)
+
+
+def get_hud_sprite(frame_size, values, line_type=cv2.LINE_AA, scale=1.0):
+    # scale resizes the boxes, text and margins together, e.g. for outputs smaller than the source.
+    # The cache is keyed on the arguments as passed, so they are always passed the same way
+    return _hud_sprite(tuple(frame_size), tuple(values), line_type, scale)
+
+
+@functools.lru_cache(maxsize=HUD_CACHE_SIZE)
+def _hud_sprite(frame_size, values, line_type, scale):
+    frame_width, frame_height = frame_size
+    box_width, box_height = round(BOX_WIDTH * scale), round(BOX_HEIGHT * scale)
+    spacing, offset = round(SPACING * scale), round(2 * scale)
+    label_scale, value_scale = LABEL_FONT_SCALE * scale, VALUE_FONT_SCALE * scale
+    thickness = max(1, round(TEXT_THICKNESS * scale))
+    start_x = frame_width - box_width - round(RIGHT_MARGIN * scale)  # 50 px right margin at scale 1
+    start_y = frame_height // 5
+
+    # lay out every box and text first so the sprite bounds include text spilling past a box
+    boxes = []
+    texts = []
+    for i, value in enumerate(values):
+        y = start_y + i * (box_height * 2 + spacing)
+        y_val = y + box_height
+        boxes.append((y, y_val, value))
+        texts.append((LABELS[i], label_scale) + _text_layout(LABELS[i], label_scale, thickness, start_x, y,
+                                                             box_width, box_height, offset))
+        texts.append((value, value_scale) + _text_layout(value, value_scale, thickness, start_x, y_val,
+                                                         box_width, box_height, offset))
+
+    x0, y0 = start_x, start_y
+    x1, y1 = start_x + box_width + 1, boxes[-1][1] + box_height + 1
+    for _, _, _, (tx0, ty0, tx1, ty1) in texts:
+        x0, y0 = min(x0, tx0), min(y0, ty0)
+        x1, y1 = max(x1, tx1), max(y1, ty1)
+
+    pixels = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+    text_alpha = np.zeros(pixels.shape[:2], dtype=np.uint8)
+    bx = start_x - x0
+    for y, y_val, value in boxes:
+        draw_gradient_box(pixels, bx, y - y0, box_width, box_height, LABEL_COLOR_TOP, LABEL_COLOR_BOTTOM)
+        color = VALUE_COLORS.get(value, DEFAULT_VALUE_COLOR)
+        cv2.rectangle(pixels, (bx, y_val - y0), (bx + box_width, y_val - y0 + box_height), color + (255,), -1)
+        pixels[y - y0:y_val - y0, bx:bx + box_width + 1, 3] = 255
+
+    # text is drawn over the opaque boxes; any coverage outside them becomes partial alpha
+    bgr = np.ascontiguousarray(pixels[..., :3])
+    for text, font_scale, (tx, ty), _ in texts:
+        cv2.putText(bgr, text, (tx - x0, ty - y0), FONT, font_scale, TEXT_COLOR, thickness, line_type)
+        cv2.putText(text_alpha, text, (tx - x0, ty - y0), FONT, font_scale, 255, thickness, line_type)
+    spill = (pixels[..., 3] == 0) & (text_alpha > 0)
+    bgr[spill] = TEXT_COLOR
+    pixels[..., :3] = bgr
+    np.maximum(pixels[..., 3], text_alpha, out=pixels[..., 3])
+
+    pixels.flags.writeable = False
+    return HudSprite(x0, y0, pixels)
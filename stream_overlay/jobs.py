@@ -0,0 +1,224 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+from .formats import BACKEND_FORMATS, DEFAULT_CODECS
+from .warmup import ping, warm_up
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def render_settings(slow_factor, slow_mode='fps', backend='opencv', encoder=None):
+    # Render settings that go into the cache key next to the input files
+    from .draw_trajectory_new import TrajectoryOverlayRenderer
+
+    return {
+        "slow_factor": slow_factor,
+        "slow_mode": slow_mode,
+        "backend": backend,
+        "codec": DEFAULT_CODECS[backend],
+        "encoder": encoder or {},
+        "style": TrajectoryOverlayRenderer.style_signature()
+    }
+
+
+def render_job(video_path, module4_json, module5_json, output_path, slow_factor, backend='opencv', encoder=None,
+               plan_cache=None, draft=False, plan_cache_bytes=None):
+    # Runs in a worker process, so it has to be a module level function
+    from .draw_trajectory_new import PLAN_CACHE_BYTES, TrajectoryOverlayRenderer
+
+    renderer = TrajectoryOverlayRenderer(
+        video_path=video_path,
+        module4_json=module4_json,
+        module5_json=module5_json,
+        output_path=output_path,
+        slow_factor=slow_factor,
+        backend=backend,
+        encoder=encoder,
+        plan_cache=plan_cache,
+        plan_cache_bytes=PLAN_CACHE_BYTES if plan_cache_bytes is None else plan_cache_bytes,
+        draft=draft
+    )
+    renderer.run()
+    return output_path
+
+
+class RenderJob:
+    def __init__(self, job_id, work_dir, output_extension='.avi'):
+        self.id = job_id
+        self.work_dir = work_dir
+        self.video_path = os.path.join(work_dir, 'input.avi')
+        self.module4_json = os.path.join(work_dir, 'module4_output.json')
+        self.module5_json = os.path.join(work_dir, 'module5_output.json')
+        self.output_path = os.path.join(work_dir, 'output' + output_extension)
+        self.draft_path = os.path.join(work_dir, 'draft' + output_extension)
+        self.future = None
+        self.cache_key = None
+        self.submitted_at = None
+        self.draft_ready_at = None
+        self.finished_at = None
+
+    @property
+    def status(self):
+        if self.future is None:
+            return 'pending'
+        if not self.future.done():
+            return 'running' if self.future.running() else 'queued'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    @property
+    def error(self):
+        if self.future is None or not self.future.done() or self.future.exception() is None:
+            return None
+        return str(self.future.exception())
+
+    def to_dict(self):
+        finished = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "elapsed": round(finished - self.submitted_at, 3) if self.submitted_at else None,
+            "draft_elapsed": round(self.draft_ready_at - self.submitted_at, 3) if self.draft_ready_at else None
+        }
+
+
+class RenderJobQueue:
+    '''
+    Renders overlay jobs on a process pool so requests return immediately.
+
+    At most max_workers jobs render at once and at most max_pending jobs
+    (running plus queued) are accepted; past that, create_job raises
+    QueueFullError so the API can tell clients to retry later. Finished jobs
+    and their files are removed after job_ttl seconds. With a RenderCache, jobs
+    whose inputs were rendered before complete immediately from the cache.
+    on_finish(job) is called whenever a job completes or fails, e.g. to record metrics.
+    backend and encoder select the output writer and plan_cache keeps compiled render
+    plans (up to plan_cache_bytes), as for TrajectoryOverlayRenderer.
+    Worker processes import OpenCV and draw the common decision boxes when
+    they start; warm() starts them ahead of the first job.
+    submit(job, draft=True) also renders a quick low-resolution draft of the
+    job on the calling thread while the pool renders the full video, to show
+    until the full render is done.
+    '''
+
+    def __init__(self, max_workers=2, max_pending=8, job_ttl=3600, cache=None, on_finish=None,
+                 backend='opencv', encoder=None, plan_cache=None, plan_cache_bytes=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.cache = cache
+        self.on_finish = on_finish
+        self.backend = backend
+        self.encoder = encoder
+        self.plan_cache = plan_cache
+        self.plan_cache_bytes = plan_cache_bytes
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created on first use so importing the app does not fork workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=warm_up)
+        return self._executor
+
+    def warm(self, timeout=None):
+        # Starts every worker process now and waits until they have warmed up
+        executor = self._get_executor()
+        wait([executor.submit(ping) for _ in range(self.max_workers)], timeout=timeout)
+
+    def _active_count(self):
+        return sum(1 for job in self._jobs.values() if job.status in ('pending', 'queued', 'running'))
+
+    def pending_count(self):
+        with self._lock:
+            return self._active_count()
+
+    def create_job(self):
+        # Reserves a slot and a working directory; the caller saves the inputs and then calls submit
+        self.prune()
+        with self._lock:
+            active = self._active_count()
+            if active >= self.max_pending:
+                raise QueueFullError(f"{active} render jobs already pending")
+            job = RenderJob(uuid.uuid4().hex, tempfile.mkdtemp(prefix='stream_overlay_'),
+                            output_extension=BACKEND_FORMATS[self.backend][0])
+            self._jobs[job.id] = job
+        return job
+
+    def submit(self, job, slow_factor=3, draft=False):
+        job.submitted_at = time.time()
+        if self.cache is not None:
+            job.cache_key = self.cache.make_key(job.video_path, job.module4_json, job.module5_json,
+                                                render_settings(slow_factor, backend=self.backend,
+                                                                encoder=self.encoder))
+            # taken into the job's own directory, where a later eviction cannot reach it
+            if self.cache.get(job.cache_key, copy_to=job.output_path) is not None:
+                job.future = Future()
+                job.future.set_result(job.output_path)
+                job.finished_at = time.time()
+                if self.on_finish is not None:
+                    self.on_finish(job)
+                return job
+
+        job.future = self._get_executor().submit(
+            render_job, job.video_path, job.module4_json, job.module5_json, job.output_path, slow_factor,
+            self.backend, self.encoder, self.plan_cache,
+            plan_cache_bytes=self.plan_cache_bytes
+        )
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        if draft:
+            # rendered while the pool works on the full video, which does not wait for it
+            self._render_draft(job, slow_factor)
+        return job
+
+    def _render_draft(self, job, slow_factor):
+        # A draft is only a preview: if it fails, or the full render finishes first, the job goes on without one
+        if job.future.done():
+            return
+        try:
+            render_job(job.video_path, job.module4_json, job.module5_json, job.draft_path, slow_factor,
+                       self.backend, None, self.plan_cache, draft=True, plan_cache_bytes=self.plan_cache_bytes)
+        except Exception:
+            return
+        job.draft_ready_at = time.time()
+
+    def _finish(self, job, future):
+        if self.cache is not None and job.cache_key is not None and future.exception() is None:
+            try:
+                self.cache.put(job.cache_key, job.output_path)
+            except OSError:
+                pass  # a failed cache write must not fail the job
+        job.finished_at = time.time()
+        if self.on_finish is not None:
+            self.on_finish(job)
+
+    def discard(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.job_ttl]
+        for job_id in expired:
+            self.discard(job_id)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
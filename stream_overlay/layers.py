@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+
+class TrajectoryLayer:
+    '''
+    Persistent overlay that the trajectory is drawn onto one segment at a time.
+
+    The layer keeps a colour canvas plus a 0/1 mask of every pixel drawn so far,
+    so each frame only has to add the newest segment and blend the masked pixels
+    onto the video frame instead of redrawing the whole path. It also tracks the
+    dirty bounding box of everything drawn, and blending is restricted to that
+    region using a preallocated buffer.
+    '''
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        self.dirty = None  # (x0, y0, x1, y1), exclusive end
+        self.drawn_index = {}  # last point reached by draw_path_to, per path
+        self._blend = np.empty_like(self.canvas)
+
+    def _union(self, box, x0, y0, x1, y1):
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return box
+        if box is None:
+            return (x0, y0, x1, y1)
+        return (min(box[0], x0), min(box[1], y0), max(box[2], x1), max(box[3], y1))
+
+    def add_segment(self, pt1, pt2, color, thickness):
+        cv2.line(self.canvas, pt1, pt2, color, thickness)
+        cv2.line(self.mask, pt1, pt2, 1, thickness)
+        pad = thickness // 2 + 2
+        self.dirty = self._union(self.dirty,
+                                 min(pt1[0], pt2[0]) - pad, min(pt1[1], pt2[1]) - pad,
+                                 max(pt1[0], pt2[0]) + pad + 1, max(pt1[1], pt2[1]) + pad + 1)
+
+    def draw_path_to(self, points, index, color, thickness, path=0):
+        # Adds the segments of points up to index that are not on the layer yet; path
+        # tells apart several paths drawn onto the same layer
+        drawn = self.drawn_index.get(path, 0)
+        while drawn < index:
+            drawn += 1
+            self.add_segment(points[drawn - 1], points[drawn], color, thickness)
+        self.drawn_index[path] = drawn
+
+    def bounds(self, circles=()):
+        # Region that compositing with these circles touches, as (rows, cols) slices
+        box = self.dirty
+        for center, radius, _ in circles:
+            box = self._union(box, center[0] - radius, center[1] - radius,
+                              center[0] + radius + 1, center[1] + radius + 1)
+        if box is None:
+            return None
+        return slice(box[1], box[3]), slice(box[0], box[2])
+
+    def composite(self, frame, alpha, circles=()):
+        # circles (ball dot, markers) only live for this frame: they are drawn on
+        # top of the segments, blended, and then the patches underneath restored
+        saved = []
+        for center, radius, color in circles:
+            region = self._union(None, center[0] - radius, center[1] - radius,
+                                 center[0] + radius + 1, center[1] + radius + 1)
+            if region is None:
+                continue
+            rows, cols = slice(region[1], region[3]), slice(region[0], region[2])
+            saved.append((rows, cols, self.canvas[rows, cols].copy(), self.mask[rows, cols].copy()))
+            cv2.circle(self.canvas, center, radius, color, -1)
+            cv2.circle(self.mask, center, radius, 1, -1)
+
+        region = self.bounds(circles)
+        if region is not None:
+            rows, cols = region
+            target = frame[rows, cols]
+            blended = cv2.addWeighted(self.canvas[rows, cols], alpha, target, 1 - alpha, 0,
+                                      dst=self._blend[rows, cols])
+            np.copyto(target, blended, where=self.mask[rows, cols].view(bool)[..., None])
+
+        for rows, cols, canvas_patch, mask_patch in reversed(saved):
+            self.canvas[rows, cols] = canvas_patch
+            self.mask[rows, cols] = mask_patch
+
+        return frame
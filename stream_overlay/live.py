@@ -0,0 +1,161 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .draw_trajectory_new import TrajectoryOverlayRenderer
+from .hud import get_hud_sprite
+from .layers import TrajectoryLayer
+from .loader import DecisionData, load_decision
+
+# a 50 fps broadcast feed leaves one frame interval per frame
+DEFAULT_FRAME_BUDGET = 1 / 50
+# latencies kept for stats()
+LATENCY_WINDOW = 1000
+
+
+class LiveOverlay:
+    '''
+    Draws the overlay on frames as they arrive, while the trajectory and the
+    decision are still being produced.
+
+    Upstream modules call push_points() as the tracker produces points and
+    set_decision() once module5 has a verdict, from any thread; process() (or
+    frames(), for a whole source) overlays each new frame with what has arrived
+    so far. Per frame only the newly arrived segments are drawn onto a
+    persistent layer, so the cost stays flat however long the path gets. The
+    look is taken from `style` (TrajectoryOverlayRenderer by default), so live
+    and file renders match.
+    '''
+
+    def __init__(self, style=TrajectoryOverlayRenderer, frame_budget=DEFAULT_FRAME_BUDGET):
+        self.style = style
+        self.frame_budget = frame_budget
+        self.frame_index = -1
+        self.layer = None
+        self.points = []  # (x, y) drawn so far
+        self.markers = []  # (point, color) visible so far
+        self.hud_values = None
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.frames_processed = 0
+        self.overruns = 0
+        self._pending = []  # (frame, x, y) pushed but not yet reached
+        self._next_frame = 0
+        self._lock = threading.Lock()
+
+    def push_points(self, points, frames=None):
+        '''
+        Adds tracked ball positions. frames gives the frame number of each point;
+        without it the points follow on one per frame from the last pushed point.
+        A point is drawn from its frame onwards, or on the next frame if it arrives late.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2).astype(np.int32).tolist()
+        with self._lock:
+            if frames is None:
+                frames = range(self._next_frame, self._next_frame + len(points))
+            for frame, (x, y) in zip(frames, points):
+                self._pending.append((int(frame), x, y))
+                self._next_frame = max(self._next_frame, int(frame) + 1)
+            self._pending.sort()
+
+    def push_event(self, name, point):
+        # Shows a marker for an event ('pitch', 'pad_impact', ...) that has a colour in style.marker_events
+        colors = {event: getattr(self.style, color) for event, color in self.style.marker_events}
+        if name in colors and point is not None:
+            with self._lock:
+                self.markers.append((tuple(int(v) for v in point[:2]), colors[name]))
+
+    def set_decision(self, decision):
+        '''
+        Shows the decision boxes from now on. decision is a module5 file path, its
+        parsed JSON object or a DecisionData; its event points become markers.
+        '''
+        if isinstance(decision, str):
+            decision = load_decision(decision)
+        elif not isinstance(decision, DecisionData):
+            decision = DecisionData(decision)
+        for name, point in decision.events.items():
+            self.push_event(name, point.tolist())
+        wickets = "Hitting" if decision.hitting_stumps else "Missing"
+        with self._lock:
+            self.hud_values = tuple(value.upper() for value in (
+                decision.pitching_result, decision.impact_result, wickets, decision.final_decision))
+
+    def _advance(self, frame_index):
+        # Moves the points that have been reached onto the layer
+        with self._lock:
+            reached = 0
+            while reached < len(self._pending) and self._pending[reached][0] <= frame_index:
+                reached += 1
+            arrived, self._pending = self._pending[:reached], self._pending[reached:]
+            markers = list(self.markers)
+            hud_values = self.hud_values
+        for _, x, y in arrived:
+            if self.points:
+                self.layer.add_segment(self.points[-1], (x, y), self.style.trajectory_color,
+                                       self.style.trajectory_thickness)
+            self.points.append((x, y))
+        return markers, hud_values
+
+    def process(self, frame, frame_index=None):
+        # Overlays frame in place and returns it; frame_index defaults to the next frame
+        started = time.perf_counter()
+        self.frame_index = self.frame_index + 1 if frame_index is None else frame_index
+        if self.layer is None:
+            self.layer = TrajectoryLayer(frame.shape[1], frame.shape[0])
+        markers, hud_values = self._advance(self.frame_index)
+
+        if self.points:
+            style = self.style
+            circles = [(self.points[-1], style.ball_dot_radius, style.trajectory_color)]
+            circles += [(point, style.marker_radius, color) for point, color in markers]
+            frame = self.layer.composite(frame, style.overlay_alpha, circles)
+        if hud_values is not None:
+            frame = get_hud_sprite((frame.shape[1], frame.shape[0]), hud_values).blit(frame)
+
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.frames_processed += 1
+        if latency > self.frame_budget:
+            self.overruns += 1
+        return frame
+
+    def frames(self, source):
+        '''
+        Yields overlaid frames from source: an iterable of BGR frames, a camera
+        index, or a path to a video file or local pipe (FIFO) that OpenCV can read.
+        Frames read from a camera or file share one buffer that the next read
+        overwrites, so show or copy each frame before advancing; list(frames(path))
+        would hold the last frame N times.
+        '''
+        if isinstance(source, (int, str)):
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                raise ValueError(f"Could not open video source {source!r}")
+            frame = None
+            try:
+                while True:
+                    ret, frame = cap.read(frame)
+                    if not ret:
+                        break
+                    yield self.process(frame)
+            finally:
+                cap.release()
+        else:
+            for frame in source:
+                yield self.process(frame)
+
+    def stats(self):
+        # Per-frame overlay latency in seconds over the last LATENCY_WINDOW frames
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        p50, p99 = np.percentile(latencies, (50, 99))
+        return {
+            "frames": self.frames_processed,
+            "p50": round(float(p50), 6),
+            "p99": round(float(p99), 6),
+            "max": round(float(latencies.max()), 6),
+            "frame_budget": self.frame_budget,
+            "overruns": self.overruns
+        }
@@ -0,0 +1,186 @@
+'''
+One loader for every upstream schema the renderers consume.
+
+Trajectory files (load_trajectory):
+    - "predicted_path" schema:  {"predicted_path": [[x, y, ...], ...]}
+    - module4 schema:           {"previous_trajectory": [[x, y, z], ...], "predicted_trajectory": [...],
+                                 "bounce_point", "leg_impact_location", "stump_impact_location",
+                                 "collision": {"spatial_detection": {"collision_point"}}}
+    - xyz schema:               {"trajectory_analysis": {"original_points": [{"x", "y", "z", "t"}, ...],
+                                 "predicted_points": [...]}, "bounce_analysis", "impact_analysis"}
+    - manual tracker output:    [{"pos_x", "pos_y", "pos_z", "timestamp", "frame"}, ...]
+
+Decision files (load_decision) follow the module5 schema.
+
+Files are parsed whole, with orjson when it is installed and the json module
+otherwise, and the fields the renderers need are pulled out once into compact
+(N, 2) int32 arrays, so nothing looks anything up in the parsed tree per frame.
+'''
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def points_array(points):
+    # [[x, y, ...], ...] -> (N, 2) int32, truncating like int() does
+    if not points:
+        return np.empty((0, 2), dtype=np.int32)
+    return np.asarray([p[:2] for p in points], dtype=np.float64).astype(np.int32)
+
+
+def _dict_points_array(points, x='x', y='y'):
+    if not points:
+        return np.empty((0, 2), dtype=np.int32)
+    return np.array([(p[x], p[y]) for p in points], dtype=np.float64).astype(np.int32)
+
+
+def _point(value):
+    if not value:
+        return None
+    return np.array(value[:2], dtype=np.float64).astype(np.int32)
+
+
+def _nested(data, *keys):
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class TrajectoryData:
+    '''
+    path:       (N, 2) int32 ball positions, one per video frame from the start of the delivery
+    predicted:  (M, 2) int32 predicted continuation after the last tracked point (may be empty)
+    timestamps: (N,) float64 seconds for each path point, or None if the schema has none
+    frames:     (N,) int64 video frame each path point was labelled on, or None if the schema has none
+    events:     name -> (2,) int32 point, for the events the schema provides
+                ('bounce', 'leg_impact', 'stump_impact', 'collision')
+    '''
+
+    def __init__(self, schema, path, predicted=None, timestamps=None, events=None, frames=None):
+        self.schema = schema
+        self.path = path
+        self.predicted = predicted if predicted is not None else np.empty((0, 2), dtype=np.int32)
+        self.timestamps = timestamps
+        self.frames = frames
+        self.events = {name: point for name, point in (events or {}).items() if point is not None}
+
+
+def detect_schema(data):
+    if isinstance(data, list):
+        return 'tracker'
+    if 'predicted_path' in data:
+        return 'predicted_path'
+    if 'previous_trajectory' in data:
+        return 'module4'
+    if 'trajectory_analysis' in data:
+        return 'xyz'
+    raise ValueError(f"Unrecognised trajectory schema with keys {sorted(data.keys())}")
+
+
+def load_trajectory(path):
+    data = read_json(path)
+    schema = detect_schema(data)
+
+    if schema == 'predicted_path':
+        return TrajectoryData(schema, points_array(data['predicted_path']))
+
+    if schema == 'module4':
+        return TrajectoryData(
+            schema,
+            points_array(data['previous_trajectory']),
+            predicted=points_array(data.get('predicted_trajectory', [])),
+            events={
+                'bounce': _point(data.get('bounce_point')),
+                'leg_impact': _point(data.get('leg_impact_location')),
+                'stump_impact': _point(data.get('stump_impact_location')),
+                'collision': _point(_nested(data, 'collision', 'spatial_detection', 'collision_point'))
+            }
+        )
+
+    if schema == 'xyz':
+        analysis = data['trajectory_analysis']
+        original = analysis.get('original_points') or []
+        path_points = _dict_points_array(original)
+        timestamps = np.array([p.get('t', 0.0) for p in original], dtype=np.float64) if original else None
+
+        # bounce_analysis is in world units, so the bounce is placed on the tracked point at its timestamp
+        bounce = None
+        bounce_time = _nested(data, 'bounce_analysis', 'timestamp')
+        if bounce_time is not None and timestamps is not None and len(timestamps):
+            bounce = path_points[int(np.argmin(np.abs(timestamps - bounce_time)))]
+
+        stump = None
+        if _nested(data, 'impact_analysis', 'stump_impact', 'will_hit'):
+            x = _nested(data, 'impact_analysis', 'stump_impact', 'impact_point', 'x')
+            y = _nested(data, 'impact_analysis', 'stump_impact', 'impact_point', 'y')
+            if x is not None and y is not None:
+                stump = np.array([x, y], dtype=np.float64).astype(np.int32)
+
+        collision = None
+        if _nested(data, 'impact_analysis', 'bat_collision', 'detected'):
+            collision = _point(_nested(data, 'impact_analysis', 'bat_collision', 'point'))
+
+        return TrajectoryData(
+            schema, path_points,
+            predicted=_dict_points_array(analysis.get('predicted_points') or []),
+            timestamps=timestamps,
+            events={'bounce': bounce, 'stump_impact': stump, 'collision': collision}
+        )
+
+    # manual tracker output; its timestamps are video times, so points are placed by their frame numbers
+    return TrajectoryData(
+        schema,
+        _dict_points_array(data, 'pos_x', 'pos_y'),
+        timestamps=np.array([p.get('timestamp', 0.0) for p in data], dtype=np.float64) if data else None,
+        frames=np.array([p['frame'] for p in data], dtype=np.int64)
+        if data and all('frame' in p for p in data) else None
+    )
+
+
+class DecisionData:
+    '''
+    Decision and event points from a module5 file.
+    '''
+
+    def __init__(self, data):
+        self._data = data
+        self.pitching_result = data.get("BallPitch", "N/A")
+        self.impact_result = data.get("PadImpact", "N/A")
+        self.hitting_stumps = bool(data.get("HittingStumps", False))
+        self.final_decision = data.get("Decision", "N/A")
+        self.reason = data.get("Reason")
+        self.events = {name: point for name, point in (
+            ('pitch', _point(data.get("BallPitchPoint"))),
+            ('pad_impact', _point(data.get("PadImpactPoint"))),
+            ('stump_impact', _point(data.get("HittingStumpsPoint")))
+        ) if point is not None}
+
+    @property
+    def bat_collision_point(self):
+        return _point(_nested(self._data, "BatEdge", "spatial_detection", "collision_point"))
+
+
+def load_decision(path):
+    data = read_json(path)
+    if not isinstance(data, dict):
+        raise ValueError("Expected the module5 output to be a JSON object")
+    return DecisionData(data)
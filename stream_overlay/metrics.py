@@ -0,0 +1,174 @@
+import math
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PERCENTILES = (50, 95, 99)
+# render latency buckets in seconds, from cache hits up to long deliveries
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def peak_rss_bytes():
+    # Peak resident set size of this process, or None where the platform does not report it
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    '''
+    Collects how long every call of each render stage takes.
+
+    Stages are timed by wrapping the functions that implement them, so nothing
+    is measured (or paid for) unless a profiler is installed. Stages can nest,
+    e.g. 'hud' runs inside 'render'.
+    '''
+
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, stage, function):
+        samples = self.samples.setdefault(stage, [])
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                samples.append(perf_counter() - start)
+
+        return timed
+
+    def summary(self):
+        # {stage: {"count", "total", "p50", "p95", "p99"}} in seconds
+        import numpy as np
+
+        summary = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.array(samples)
+            summary[stage] = {"count": len(values), "total": round(float(values.sum()), 6)}
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                summary[stage][f"p{percentile}"] = round(float(value), 6)
+        return summary
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    # Exact, unlike :g (six significant digits), so rate() over large counters and sums does not step
+    if isinstance(value, int):
+        return str(int(value))  # int() turns bools into 0/1
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.kind = 'counter'
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return [(self.name + _format_labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = 'histogram'
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append((self.name + '_bucket' + _format_labels(key + (('le', f'{bound:g}'),)), bucket_count))
+                lines.append((self.name + '_bucket' + _format_labels(key + (('le', '+Inf'),)), count))
+                lines.append((self.name + '_sum' + _format_labels(key), total))
+                lines.append((self.name + '_count' + _format_labels(key), count))
+        return lines
+
+
+class Callback:
+    # A value read from elsewhere (e.g. the job queue) each time metrics are collected
+    def __init__(self, name, help, function, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.function = function
+
+    def collect(self):
+        return [(self.name, self.function())]
+
+
+class MetricsRegistry:
+    '''
+    Minimal set of counters, histograms and gauges rendered in the Prometheus
+    text exposition format, so the API can be scraped without extra dependencies.
+    '''
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self._register(Counter(name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, buckets))
+
+    def callback(self, name, help, function, kind='gauge'):
+        return self._register(Callback(name, help, function, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for series, value in metric.collect():
+                if value is not None:
+                    lines.append(f"{series} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,194 @@
+import queue
+import subprocess
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from .formats import DEFAULT_CODECS
+
+# how long a blocked write waits before checking whether the encoder died
+WRITE_POLL_INTERVAL = 0.1
+
+
+class OpenCVWriter:
+    # cv2.VideoWriter with a FourCC codec, encoding on the calling thread
+    def __init__(self, path, fps, size, codec='XVID', **_):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegWriter:
+    '''
+    Pipes raw BGR frames into a local ffmpeg process.
+
+    write() only copies the frame into a bounded queue; a thread feeds the queue
+    to ffmpeg's stdin, so encoding overlaps with rendering. When the encoder
+    falls queue_size frames behind, write() blocks until it catches up. codec,
+    preset, crf and threads are passed to ffmpeg as they are, e.g.
+    libx264/ultrafast for live use and a slower preset for archiving.
+    '''
+
+    def __init__(self, path, fps, size, codec='libx264', preset='veryfast', crf=23, threads=None,
+                 pix_fmt='yuv420p', queue_size=8, executable='ffmpeg'):
+        width, height = size
+        command = [executable, '-hide_banner', '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps:g}',
+                   '-i', '-', '-an', '-c:v', codec]
+        if preset is not None:
+            command += ['-preset', preset]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        if threads is not None:
+            command += ['-threads', str(threads)]
+        if pix_fmt == 'yuv420p' and (width % 2 or height % 2):
+            # 4:2:0 chroma needs even dimensions
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        command += ['-pix_fmt', pix_fmt, path]
+        self.path = path
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=self._stderr)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._feed, name='overlay-ffmpeg', daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                self.process.stdin.write(data)
+        except OSError as e:
+            self._error = e
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def _failure(self, message):
+        self._stderr.seek(0)
+        details = self._stderr.read().decode(errors='replace').strip()
+        return RuntimeError(f"{message} while writing {self.path}" + (f": {details}" if details else ""))
+
+    def write(self, frame):
+        data = np.ascontiguousarray(frame).tobytes()
+        while True:
+            if self._error is not None or not self._thread.is_alive():
+                self.process.wait()
+                raise self._failure(f"ffmpeg exited with status {self.process.returncode}")
+            try:
+                self._queue.put(data, timeout=WRITE_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def release(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        returncode = self.process.wait()
+        try:
+            if returncode != 0 or self._error is not None:
+                raise self._failure(f"ffmpeg exited with status {returncode}")
+        finally:
+            self._stderr.close()
+
+
+WRITER_BACKENDS = {'opencv': OpenCVWriter, 'ffmpeg': FFmpegWriter}
+
+
+class OutputSpec:
+    '''
+    One rendered variant of a delivery.
+
+    path:        output video file
+    size:        (width, height) of the output, or None to keep the (cropped) source size
+    backend:     writer backend, 'opencv' (cv2.VideoWriter) or 'ffmpeg' (pipe to an ffmpeg process)
+    codec:       FourCC code for 'opencv', ffmpeg encoder name for 'ffmpeg'; None for the backend's default
+    encoder:     extra writer options, e.g. {'preset': 'ultrafast', 'crf': 28, 'threads': 2} for 'ffmpeg'
+    slow_factor: slow_factor for this output, or None to use the renderer's
+    hud:         whether the decision boxes are drawn
+    crop:        (x, y, width, height) region of the source frame, or None for the whole frame
+    hud_scale:   size of the decision boxes relative to the source layout, or None to
+                 scale them with the output height
+    '''
+
+    def __init__(self, path, size=None, codec=None, slow_factor=None, hud=True, crop=None, hud_scale=None,
+                 backend='opencv', encoder=None):
+        if backend not in WRITER_BACKENDS:
+            raise ValueError(f"backend must be one of {tuple(WRITER_BACKENDS)}, got {backend!r}")
+        self.path = path
+        self.size = tuple(size) if size is not None else None
+        self.backend = backend
+        self.codec = codec or DEFAULT_CODECS[backend]
+        self.encoder = dict(encoder or {})
+        self.slow_factor = slow_factor
+        self.hud = hud
+        self.crop = tuple(crop) if crop is not None else None
+        self.hud_scale = hud_scale
+
+
+class OutputSink:
+    '''
+    Writer for one OutputSpec: crops and resizes the shared rendered frame into
+    its own buffer, so several sinks can be fed from a single decode.
+    '''
+
+    def __init__(self, spec, source_size, fps, repeat):
+        self.spec = spec
+        source_width, source_height = source_size
+        x, y, width, height = spec.crop or (0, 0, source_width, source_height)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, source_width), min(y + height, source_height)
+        if x0 >= x1 or y0 >= y1:
+            raise ValueError(f"Crop {spec.crop} is outside the {source_width}x{source_height} frame")
+        self.region = (slice(y0, y1), slice(x0, x1)) if spec.crop else None
+        self.size = spec.size or (x1 - x0, y1 - y0)
+        self.resize = self.size != (x1 - x0, y1 - y0)
+        if spec.hud_scale is not None:
+            self.hud_scale = spec.hud_scale
+        else:
+            self.hud_scale = self.size[1] / source_height if self.resize else 1.0
+        self.fps = fps
+        self.repeat = repeat
+        # set on the one sink that may draw its HUD straight onto the shared frame
+        self.in_place = False
+        self._buffer = None
+        self.writer = WRITER_BACKENDS[spec.backend](spec.path, fps, self.size, codec=spec.codec, **spec.encoder)
+
+    @property
+    def passthrough(self):
+        return self.region is None and not self.resize
+
+    def prepare(self, frame):
+        # Returns the frame this sink writes; it is only the shared frame itself
+        # when nothing is changed or the sink is allowed to draw on it
+        if self.region is not None:
+            frame = frame[self.region]
+        if self.resize:
+            self._buffer = cv2.resize(frame, self.size, dst=self._buffer, interpolation=cv2.INTER_AREA)
+            return self._buffer
+        if self.region is not None or (self.spec.hud and not self.in_place):
+            if self._buffer is None:
+                self._buffer = np.empty_like(frame)
+            np.copyto(self._buffer, frame)
+            return self._buffer
+        return frame
+
+    def write(self, frame, hold=1):
+        # hold: times the frame is shown, e.g. a paused frame; each is repeated for slow motion
+        for _ in range(self.repeat * hold):
+            self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
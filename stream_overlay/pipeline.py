@@ -0,0 +1,135 @@
+import queue
+import threading
+
+# queue sentinel telling a stage that no more frames are coming
+_DONE = object()
+
+
+class FramePipeline:
+    '''
+    Decoder thread -> render worker threads -> ordered encoder thread.
+
+    OpenCV releases the GIL while decoding, blending and encoding, so the stages
+    overlap. Frames travel through bounded queues tagged with their sequence
+    number, and the encoder writes them strictly in that order, so the output is
+    the same as rendering sequentially.
+
+    read_frame(buffer) returns a decoded frame (reusing buffer where it can) or None
+    at the end of the input; render_frame(frame, seq, state) returns the frame to
+    write; make_state() builds the per-worker state passed to render_frame, and
+    write_frame(frame) encodes it.
+    '''
+
+    def __init__(self, read_frame, render_frame, write_frame, make_state=None,
+                 workers=2, queue_depth=8):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_depth < 1:
+            raise ValueError("queue_depth must be at least 1")
+        self.read_frame = read_frame
+        self.render_frame = render_frame
+        self.write_frame = write_frame
+        self.make_state = make_state or (lambda: None)
+        self.workers = workers
+        self.queue_depth = queue_depth
+
+        # buffers are recycled from the encoder back to the decoder, which also
+        # bounds how many frames can be in flight at once
+        self._free = queue.Queue()
+        for _ in range(2 * queue_depth + workers):
+            self._free.put(None)
+        self._to_render = queue.Queue(maxsize=queue_depth)
+        self._to_encode = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._errors = []
+        self.frames_written = 0
+
+    def _put(self, q, item):
+        # put that gives up when another stage has failed, so nothing blocks forever
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _decode(self):
+        try:
+            seq = 0
+            while True:
+                buffer = self._get(self._free)
+                if buffer is _DONE:
+                    return
+                frame = self.read_frame(buffer)
+                if frame is None:
+                    break
+                if not self._put(self._to_render, (seq, frame)):
+                    return
+                seq += 1
+            for _ in range(self.workers):
+                self._put(self._to_render, _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _render(self):
+        try:
+            state = self.make_state()
+            while True:
+                item = self._get(self._to_render)
+                if item is _DONE:
+                    break
+                seq, frame = item
+                if not self._put(self._to_encode, (seq, frame, self.render_frame(frame, seq, state))):
+                    return
+            self._put(self._to_encode, _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _encode(self):
+        try:
+            pending = {}
+            next_seq = 0
+            finished_workers = 0
+            while finished_workers < self.workers:
+                item = self._get(self._to_encode)
+                if item is _DONE:
+                    if self._stop.is_set():
+                        return
+                    finished_workers += 1
+                    continue
+                seq, buffer, rendered = item
+                pending[seq] = (buffer, rendered)
+                while next_seq in pending:
+                    buffer, rendered = pending.pop(next_seq)
+                    self.write_frame(rendered)
+                    self.frames_written += 1
+                    self._free.put(buffer)
+                    next_seq += 1
+        except Exception as e:
+            self._fail(e)
+
+    def run(self):
+        threads = [threading.Thread(target=self._decode, name="overlay-decode")]
+        threads += [threading.Thread(target=self._render, name=f"overlay-render-{i}")
+                    for i in range(self.workers)]
+        threads.append(threading.Thread(target=self._encode, name="overlay-encode"))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+        return self.frames_written
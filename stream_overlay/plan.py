@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .cache import hash_file
+
+# bumped whenever the plan layout or what goes into it changes, so cached plans are recompiled
+PLAN_VERSION = 1
+
+
+class RenderPlan:
+    '''
+    Everything a render draws, decided up front for every output frame.
+
+    A plan is compiled once from the trajectory, the decision and the style,
+    and then replayed by any executor: each output frame only looks up its row
+    in a few arrays instead of re-deciding what is visible.
+
+    paths:    [(points, color, thickness)], each points an (K, 2) int32 array; drawn in order
+    segments: (F, len(paths)) int32, the last point of each path drawn by each frame (-1 for none)
+    source:   (F,) int32 input frame (counted from first_frame) each output frame shows
+    ball:     (F,) int32 index into paths[0] of the ball dot, or -1 for no dot
+    markers:  (F,) int64 bitmask of the marker_circles visible on each frame
+    hud:      (F,) int16 index into huds of the decision boxes shown, or -1 for none
+    holds:    (F,) int32 how many times each frame is written (before slow-motion repeats)
+    huds:     [(values, line_type)] decision box contents, for get_hud_sprite
+    '''
+
+    def __init__(self, first_frame, paths, segments, source, ball, ball_style, markers, marker_circles,
+                 hud, huds, holds=None, alpha=0.3):
+        self.first_frame = int(first_frame)
+        self.paths = [(np.asarray(points, dtype=np.int32).reshape(-1, 2), tuple(color), int(thickness))
+                      for points, color, thickness in paths]
+        self.source = np.asarray(source, dtype=np.int32)
+        self.frames = len(self.source)
+        self.segments = np.asarray(segments, dtype=np.int32).reshape(self.frames, len(self.paths))
+        self.ball = np.asarray(ball, dtype=np.int32)
+        self.ball_style = (int(ball_style[0]), tuple(ball_style[1]))  # (radius, color)
+        self.markers = np.asarray(markers, dtype=np.int64)
+        self.marker_circles = [(tuple(point), int(radius), tuple(color)) for point, radius, color in marker_circles]
+        self.hud = np.asarray(hud, dtype=np.int16)
+        self.huds = [(tuple(values), int(line_type)) for values, line_type in huds]
+        self.holds = np.ones(self.frames, dtype=np.int32) if holds is None else np.asarray(holds, dtype=np.int32)
+        self.alpha = float(alpha)
+        # frames that need a new input frame decoded, and whether any input frame is shown twice
+        self.decode = np.ones(self.frames, dtype=bool)
+        self.decode[1:] = self.source[1:] != self.source[:-1]
+        self.reuses_source = not self.decode.all()
+        self._build_lookups()
+
+    def _build_lookups(self):
+        # Python objects for the drawing calls, built once so replay is only indexing
+        self._paths = [([tuple(p) for p in points.tolist()], color, thickness)
+                       for points, color, thickness in self.paths]
+        self._segments = [tuple(row) for row in self.segments.tolist()]
+        marker_sets = {mask: [circle for i, circle in enumerate(self.marker_circles) if mask >> i & 1]
+                       for mask in set(self.markers.tolist())}
+        radius, color = self.ball_style
+        ball_points = self._paths[0][0] if self._paths else []
+        self._circles = [([(ball_points[b], radius, color)] if b >= 0 else []) + marker_sets[m]
+                         for b, m in zip(self.ball.tolist(), self.markers.tolist())]
+
+    def __getstate__(self):
+        # the lookups are rebuilt on the other side instead of being pickled
+        return {name: value for name, value in self.__dict__.items() if not name.startswith('_')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_lookups()
+
+    @property
+    def source_frames(self):
+        # number of input frames the plan reads
+        return int(self.source[-1]) + 1 if self.frames else 0
+
+    def output_range(self, start, stop):
+        # Output frames [first, last) showing input frames [start, stop), counted from first_frame
+        return tuple(int(i) for i in np.searchsorted(self.source, (start, stop)))
+
+    def draw(self, frame, index, layer):
+        # Draws output frame index onto frame in place; a layer must be given increasing indices
+        for path, ((points, color, thickness), count) in enumerate(zip(self._paths, self._segments[index])):
+            layer.draw_path_to(points, count, color, thickness, path=path)
+        return layer.composite(frame, self.alpha, self._circles[index])
+
+    def save(self, path):
+        meta = {
+            "version": PLAN_VERSION,
+            "first_frame": self.first_frame,
+            "paths": [{"color": color, "thickness": thickness} for _, color, thickness in self.paths],
+            "ball_style": self.ball_style,
+            "marker_circles": self.marker_circles,
+            "huds": self.huds,
+            "alpha": self.alpha
+        }
+        arrays = {f"path_{i}": points for i, (points, _, _) in enumerate(self.paths)}
+        # written under a temporary name so a concurrent reader never sees half a file
+        fd, partial = tempfile.mkstemp(suffix='.partial', dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), source=self.source, segments=self.segments,
+                                ball=self.ball, markers=self.markers, hud=self.hud, holds=self.holds, **arrays)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != PLAN_VERSION:
+                raise ValueError(f"{path} is a version {meta['version']} plan, expected {PLAN_VERSION}")
+            paths = [(data[f"path_{i}"], style["color"], style["thickness"]) for i, style in enumerate(meta["paths"])]
+            return cls(meta["first_frame"], paths, data["segments"], data["source"], data["ball"],
+                       meta["ball_style"], data["markers"], meta["marker_circles"], data["hud"], meta["huds"],
+                       holds=data["holds"], alpha=meta["alpha"])
+
+
+def plan_key(module4_json, module5_json, settings):
+    # Cache key of the plan compiled from these files with these settings (fps, window, style, ...)
+    digest = hashlib.sha256()
+    for path in (module4_json, module5_json):
+        digest.update(hash_file(path).encode())
+    digest.update(json.dumps({"version": PLAN_VERSION, **settings}, sort_keys=True, default=list).encode())
+    return digest.hexdigest()
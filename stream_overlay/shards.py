@@ -0,0 +1,99 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+# shards shorter than this many input frames cost more to start than they save
+MIN_SHARD_FRAMES = 30
+
+
+def sharding_available(ffmpeg='ffmpeg', ffprobe='ffprobe'):
+    '''
+    Whether shards can be split at keyframes and joined without re-encoding,
+    which needs both ffprobe and ffmpeg on the PATH. Without them a joined
+    output would cost a lossy serial re-encode, slower than not sharding.
+    '''
+    return shutil.which(ffmpeg) is not None and shutil.which(ffprobe) is not None
+
+
+def shard_count(shards):
+    # Shard processes worth starting for a requested count: 0 when sharding is unavailable, at most one per core
+    if shards <= 1 or not sharding_available():
+        return 0
+    return min(shards, os.cpu_count() or 1)
+
+
+def keyframes(video_path, executable='ffprobe'):
+    '''
+    Frame numbers of the keyframes of video_path, from the packet flags that
+    ffprobe reports without decoding anything. None when ffprobe is not
+    installed or cannot read the file.
+    '''
+    if shutil.which(executable) is None:
+        return None
+    result = subprocess.run([executable, '-v', 'error', '-select_streams', 'v:0',
+                             '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    packets = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(',')
+        try:
+            packets.append((float(pts), 'K' in flags))
+        except ValueError:
+            continue  # packets without a timestamp
+    # packets come in decode order; frame numbers count in presentation order
+    packets.sort()
+    return [number for number, (_, key) in enumerate(packets) if key]
+
+
+def plan_shards(first_frame, frames, shards, keyframes=None, min_frames=MIN_SHARD_FRAMES):
+    '''
+    Splits the input frames [first_frame, first_frame + frames) into up to
+    shards contiguous (start, stop) ranges of about equal length.
+
+    Each boundary moves to the nearest keyframe within half a shard of it, so a
+    shard's first frame decodes without the frames before it; boundaries with
+    no keyframe that close stay where they are, and seeking there decodes
+    forward from the previous keyframe.
+    '''
+    shards = max(1, min(shards, frames // min_frames))
+    stop = first_frame + frames
+    candidates = [k for k in keyframes if first_frame < k < stop] if keyframes is not None else []
+    bounds = [first_frame]
+    for i in range(1, shards):
+        target = first_frame + round(i * frames / shards)
+        nearest = min(candidates, key=lambda k: abs(k - target), default=None)
+        if nearest is not None and abs(nearest - target) <= frames / (2 * shards):
+            target = nearest
+        if bounds[-1] < target < stop:
+            bounds.append(target)
+    bounds.append(stop)
+    return list(zip(bounds, bounds[1:]))
+
+
+def concat_segments(segments, output_path, executable='ffmpeg'):
+    '''
+    Joins the segment videos, in order, into output_path. The encoded packets
+    are copied as they are with ffmpeg's concat demuxer, so nothing is
+    re-encoded; RuntimeError when ffmpeg is missing or fails.
+    '''
+    if len(segments) == 1:
+        os.replace(segments[0], output_path)
+        return
+    if shutil.which(executable) is None:
+        raise RuntimeError(f"{executable} is needed to join the segments of {output_path}")
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as listing:
+        for segment in segments:
+            escaped = os.path.abspath(segment).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run([executable, '-hide_banner', '-loglevel', 'error', '-y',
+                                 '-f', 'concat', '-safe', '0', '-i', listing.name,
+                                 '-map', '0', '-c', 'copy', output_path],
+                                stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    finally:
+        os.remove(listing.name)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not join the segments of {output_path}: {result.stderr.strip()}")
@@ -0,0 +1,187 @@
+import multiprocessing
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# how often blocked stages wake up to check whether another stage failed
+POLL_INTERVAL = 0.1
+
+
+class FrameRing:
+    '''
+    Fixed set of frame slots in one shared memory block.
+
+    frames[slot] is an (height, width, 3) uint8 view that every process
+    attached to the ring sees, so frames move between processes as slot
+    indices instead of pickled arrays. The creating process must unlink() the
+    block once every process has closed it.
+    '''
+
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        size = slots * int(np.prod(self.shape))
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self._memory.buf)
+
+    @classmethod
+    def attach(cls, name, slots, shape):
+        return cls(slots, shape, name=name)
+
+    def close(self):
+        # views into the block must be gone before it can be closed
+        self.frames = None
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+def _render_worker(ring_name, slots, shape, render_frame, make_state, tasks, results):
+    # Renders frames in place in their ring slots until the None sentinel arrives
+    ring = FrameRing.attach(ring_name, slots, shape)
+    try:
+        state = make_state() if make_state is not None else None
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot = task
+            frame = ring.frames[slot]
+            rendered = render_frame(frame, seq, state)
+            if rendered is not frame:
+                np.copyto(frame, rendered)
+            results.put((seq, slot))
+        results.put(None)
+    except BaseException:
+        results.put(('error', traceback.format_exc()))
+    finally:
+        ring.close()
+
+
+class ProcessFramePipeline:
+    '''
+    Decoder thread -> render worker processes -> ordered encoder, over a FrameRing.
+
+    Like FramePipeline, but the render stage runs in separate processes so it
+    scales past the GIL. The decoder reads each frame straight into a free ring
+    slot, a worker draws on that slot in place and the encoder writes it out in
+    sequence order and frees it again; only (sequence, slot) pairs travel
+    through the queues.
+
+    read_frame(buffer) fills buffer (a ring slot) and returns it, or None at the
+    end of the input; render_frame(frame, seq, state) and make_state() run in
+    the workers, so they have to be picklable; write_frame(frame) encodes a frame.
+    '''
+
+    def __init__(self, read_frame, render_frame, write_frame, frame_shape, make_state=None,
+                 workers=2, queue_depth=8):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_depth < 1:
+            raise ValueError("queue_depth must be at least 1")
+        self.read_frame = read_frame
+        self.render_frame = render_frame
+        self.write_frame = write_frame
+        self.frame_shape = tuple(frame_shape)
+        self.make_state = make_state
+        self.workers = workers
+        # every slot is either free, waiting to render, rendering or waiting to encode
+        self.slots = queue_depth + workers
+        self.frames_written = 0
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _decode(self, ring, free, tasks):
+        try:
+            seq = 0
+            while not self._stop.is_set():
+                try:
+                    slot = free.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                view = ring.frames[slot]
+                frame = self.read_frame(view)
+                if frame is None:
+                    break
+                if not np.may_share_memory(frame, view):
+                    np.copyto(view, frame)
+                tasks.put((seq, slot))
+                seq += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.workers):
+                tasks.put(None)
+
+    def _encode(self, ring, free, results, processes):
+        pending = {}
+        next_seq = 0
+        finished_workers = 0
+        while finished_workers < self.workers:
+            try:
+                item = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise RuntimeError("A render worker process died")
+                if self._stop.is_set():
+                    return
+                continue
+            if item is None:
+                finished_workers += 1
+                continue
+            if item[0] == 'error':
+                raise RuntimeError(f"Render worker failed:\n{item[1]}")
+            seq, slot = item
+            pending[seq] = slot
+            while next_seq in pending:
+                slot = pending.pop(next_seq)
+                self.write_frame(ring.frames[slot])
+                self.frames_written += 1
+                free.put(slot)
+                next_seq += 1
+
+    def run(self):
+        ring = FrameRing(self.slots, self.frame_shape)
+        context = multiprocessing.get_context()
+        tasks, results = context.Queue(), context.Queue()
+        free = queue.Queue()
+        for slot in range(self.slots):
+            free.put(slot)
+        processes = [
+            context.Process(target=_render_worker, name=f"overlay-render-{i}", daemon=True,
+                            args=(ring.name, self.slots, self.frame_shape, self.render_frame,
+                                  self.make_state, tasks, results))
+            for i in range(self.workers)
+        ]
+        try:
+            for process in processes:
+                process.start()
+            decoder = threading.Thread(target=self._decode, args=(ring, free, tasks), name="overlay-decode")
+            decoder.start()
+            try:
+                self._encode(ring, free, results, processes)
+            except BaseException as e:
+                self._fail(e)
+            decoder.join()
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        finally:
+            ring.close()
+            ring.unlink()
+        if self._errors:
+            raise self._errors[0]
+        return self.frames_written
@@ -0,0 +1,221 @@
+import errno
+import os
+import struct
+import threading
+import time
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import NEED_DATA, Data, Epilogue, Field, File, MultipartDecoder
+
+CHUNK_SIZE = 64 * 1024
+MJPEG_BOUNDARY = 'overlayframe'
+# start of the video part looked at to tell whether its container can be decoded from a pipe
+SNIFF_BYTES = 64 * 1024
+
+
+def streamable_container(head):
+    '''
+    Whether a video starting with the bytes head can be demuxed as it arrives,
+    without seeking: AVI, Matroska/WebM, MPEG-TS and fragmented MP4. Anything
+    else, notably a regular MP4 with its index after the media data, has to be
+    on disk in full before it can be decoded.
+    '''
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return True
+    if head[:4] == b'\x1a\x45\xdf\xa3':  # EBML header: Matroska, WebM
+        return True
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:  # TS packets start with a sync byte
+        return True
+    # MP4: fragmented files announce fragments (mvex) in the moov box, which comes before any media data
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[offset:offset + 8])
+        if size == 1 and offset + 16 <= len(head):
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if kind == b'moov':
+            return b'mvex' in head[offset:offset + size]
+        if kind == b'moof':
+            return True
+        if kind == b'mdat' or size < 8:
+            return False
+        offset += size
+    return False
+
+
+class StreamingUpload:
+    '''
+    Reads a multipart upload straight off the request stream.
+
+    Small parts (the module4/module5 JSON files) are kept in memory. When every
+    other part arrives before the video, the platform has FIFOs and the video's
+    container can be demuxed without seeking (see streamable_container), the
+    video part is piped to the decoder through a FIFO while it is still being
+    uploaded; otherwise it is spooled to a file in work_dir first.
+    '''
+
+    def __init__(self, stream, content_type, work_dir, video_field='video'):
+        boundary = parse_options_header(content_type or '')[1].get('boundary')
+        if not boundary:
+            raise ValueError("Expected a multipart/form-data upload")
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode())
+        self._events = self._iter_events()
+        self._feeder = None
+        self._stop = threading.Event()
+        self.work_dir = work_dir
+        self.video_field = video_field
+        self.parts = {}
+        self.video_path = None
+        self._head = b''
+        self._head_complete = False
+        self.streamed = False
+        self.error = None
+
+    def _iter_events(self):
+        ended = False
+        while True:
+            event = self._decoder.next_event()
+            if event is NEED_DATA:
+                if ended:
+                    raise ValueError("Upload ended before the multipart body was complete")
+                chunk = self._stream.read(CHUNK_SIZE)
+                ended = not chunk
+                self._decoder.receive_data(chunk or None)
+                continue
+            yield event
+            if isinstance(event, Epilogue):
+                return
+
+    def _copy_part(self, write):
+        # Passes the data of the current part to write; write may be None to discard it
+        for event in self._events:
+            if isinstance(event, Data):
+                if write is not None:
+                    write(event.data)
+                if not event.more_data:
+                    return
+
+    def _read_head(self, size):
+        # Reads at least size bytes of the current part (less if it ends first)
+        head = bytearray()
+        for event in self._events:
+            if isinstance(event, Data):
+                head.extend(event.data)
+                if not event.more_data:
+                    return bytes(head), True
+                if len(head) >= size:
+                    return bytes(head), False
+        return bytes(head), True
+
+    def _write_video(self, write):
+        # Passes the video part, including the head already read, to write
+        write(self._head)
+        if not self._head_complete:
+            self._copy_part(write)
+
+    def open(self, expected_parts):
+        # Consumes the upload up to the video part and returns the path the video can be decoded from
+        for event in self._events:
+            if isinstance(event, (Field, File)):
+                if event.name == self.video_field:
+                    self._head, self._head_complete = self._read_head(SNIFF_BYTES)
+                    if all(name in self.parts for name in expected_parts) and hasattr(os, 'mkfifo') \
+                            and streamable_container(self._head):
+                        return self._pipe_video()
+                    self.video_path = os.path.join(self.work_dir, 'input.avi')
+                    with open(self.video_path, 'wb') as f:
+                        self._write_video(f.write)
+                else:
+                    part = self.parts.setdefault(event.name, bytearray())
+                    self._copy_part(part.extend)
+        return self.video_path
+
+    def _pipe_video(self):
+        self.video_path = os.path.join(self.work_dir, 'input.fifo')
+        os.mkfifo(self.video_path)
+        self.streamed = True
+        self._feeder = threading.Thread(target=self._feed, name='overlay-upload', daemon=True)
+        self._feeder.start()
+        return self.video_path
+
+    def _open_fifo(self):
+        # Non-blocking open fails until the decoder opens the read end; poll so a
+        # renderer that never gets that far cannot leave this thread stuck
+        while not self._stop.is_set():
+            try:
+                fd = os.open(self.video_path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                time.sleep(0.01)
+                continue
+            os.set_blocking(fd, True)
+            return os.fdopen(fd, 'wb')
+        return None
+
+    def _feed(self):
+        try:
+            fifo = self._open_fifo()
+            if fifo is None:
+                return
+            with fifo:
+                def write(data):
+                    nonlocal fifo
+                    if fifo is None:
+                        return
+                    try:
+                        fifo.write(data)
+                    except BrokenPipeError:
+                        # the decoder stopped reading (e.g. the trajectory ended); drain the rest
+                        fifo = None
+                self._write_video(write)
+            # read the remainder of the body so the connection stays usable
+            for _ in self._events:
+                pass
+            self._answer_reopens()
+        except Exception as e:
+            self.error = e
+
+    def _answer_reopens(self):
+        # OpenCV tries its other backends on a stream it cannot decode, and they open the FIFO
+        # again; each is given an immediate end of file instead of waiting for a writer forever
+        while not self._stop.is_set():
+            try:
+                os.close(os.open(self.video_path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            time.sleep(0.01)
+
+    def close(self):
+        self._stop.set()
+        if self._feeder is not None:
+            self._feeder.join(timeout=5)
+
+
+def mjpeg_stream(renderer, quality=90):
+    '''
+    Encodes the renderer's frames as a multipart/x-mixed-replace MJPEG stream.
+
+    Each part is sent as soon as its frame is rendered, so playback can start
+    after the first frame. X-Timestamp carries the frame's presentation time in
+    the slowed-down output, so clients can pace playback. Raises ValueError,
+    before yielding anything, when no frame can be decoded.
+    '''
+    import cv2
+
+    frame_duration = renderer.repeat / renderer.fps if renderer.fps else 0.0
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    i = -1
+    for i, frame in enumerate(renderer.iter_frames()):
+        ok, jpeg = cv2.imencode('.jpg', frame, params)
+        if not ok:
+            raise RuntimeError(f"Could not encode frame {i}")
+        header = (f"--{MJPEG_BOUNDARY}\r\n"
+                  f"Content-Type: image/jpeg\r\n"
+                  f"Content-Length: {len(jpeg)}\r\n"
+                  f"X-Timestamp: {i * frame_duration:.6f}\r\n\r\n")
+        yield header.encode() + jpeg.tobytes() + b"\r\n"
+    if i < 0:
+        raise ValueError("No frames could be decoded from the video")
+    yield f"--{MJPEG_BOUNDARY}--\r\n".encode()
@@ -0,0 +1,120 @@
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # optional, only used for dense paths
+    cKDTree = None
+
+# below this many path points a brute-force distance matrix beats building a tree
+KDTREE_MIN_POINTS = 4096
+# bound on the distance matrix size (targets x path points) per batch
+BRUTE_FORCE_BLOCK = 1 << 20
+# how strongly SmoothPath pins each fitted piece to its end points
+ENDPOINT_WEIGHT = 100.0
+
+
+def nearest_indices(path, targets):
+    '''
+    Index of the closest path point for each target, in one batched call.
+
+    path is (N, 2), targets is (M, 2); returns (M,) int64, -1 for every target
+    when the path is empty. Ties go to the earliest path point, like a linear
+    scan. Dense paths use a KD-tree when scipy is installed.
+    '''
+    path = np.asarray(path)
+    targets = np.asarray(targets).reshape(-1, 2)
+    if len(path) == 0:
+        return np.full(len(targets), -1, dtype=np.int64)
+    if len(targets) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if cKDTree is not None and len(path) >= KDTREE_MIN_POINTS:
+        _, indices = cKDTree(path).query(targets)
+        return np.asarray(indices, dtype=np.int64)
+
+    path = path.astype(np.float64)
+    targets = targets.astype(np.float64)
+    rows = max(1, BRUTE_FORCE_BLOCK // len(path))
+    indices = np.empty(len(targets), dtype=np.int64)
+    for start in range(0, len(targets), rows):
+        block = targets[start:start + rows]
+        distances = ((path[None, :, :] - block[:, None, :]) ** 2).sum(axis=2)
+        indices[start:start + rows] = distances.argmin(axis=1)
+    return indices
+
+
+def event_indices(path, events):
+    # {name: point} -> {name: index of the closest path point}, all looked up together
+    names = list(events)
+    if not names:
+        return {}
+    indices = nearest_indices(path, np.array([events[name] for name in names]))
+    return dict(zip(names, indices.tolist()))
+
+
+
+def point_frames(count, timestamps, fps, start_frame=None, frames=None):
+    '''
+    Video frame number of each of the count trajectory points.
+
+    Points with usable (strictly increasing) frame numbers, as the manual
+    tracker labels them, keep their spacing and start at start_frame, or where
+    they were labelled when start_frame is None. Otherwise points are placed
+    by their timestamps (seconds after start_frame) when the schema has usable
+    ones, and failing that they are taken to be one per frame, as the
+    renderers have always assumed.
+    '''
+    if frames is not None and count > 0:
+        frames = np.asarray(frames, dtype=np.int64)
+        if len(frames) == count and np.all(np.diff(frames) > 0):
+            first = int(frames[0]) if start_frame is None else start_frame
+            return first + frames - frames[0]
+    start_frame = start_frame or 0
+    if timestamps is not None and fps > 0 and count > 1:
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) == count and np.all(np.diff(timestamps) > 0):
+            return start_frame + np.rint(timestamps * fps).astype(np.int64)
+    return start_frame + np.arange(count, dtype=np.int64)
+
+
+class SmoothPath:
+    '''
+    Piecewise polynomial fit of a tracked path, for drawing it between samples.
+
+    The path is split at the given break indices (e.g. the bounce, where the ball
+    changes direction) and x(t) and y(t) are fitted per piece by least squares;
+    degree 2 is a projectile between breaks. Each piece is pinned to its end
+    points, so the pieces meet at the breaks. Calling the fit with an array of
+    times evaluates every piece at once; times outside the path are clamped.
+    '''
+
+    def __init__(self, times, path, breaks=(), degree=2):
+        times = np.asarray(times, dtype=np.float64)
+        path = np.asarray(path, dtype=np.float64)
+        if len(path) == 0:
+            raise ValueError("Cannot fit an empty path")
+        bounds = sorted({0, len(path) - 1, *(b for b in breaks if 0 < b < len(path) - 1)})
+        self.edges = times[bounds]
+        self.coefficients = np.zeros((max(len(bounds) - 1, 1), 2, degree + 1))
+        if len(bounds) == 1:
+            self.coefficients[0, :, -1] = path[0]
+        for piece, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            t = times[start:end + 1] - times[start]
+            weights = np.ones(len(t))
+            weights[[0, -1]] = ENDPOINT_WEIGHT
+            fit_degree = min(degree, len(t) - 1)
+            for axis in range(2):
+                self.coefficients[piece, axis, degree - fit_degree:] = np.polyfit(
+                    t, path[start:end + 1, axis], fit_degree, w=weights)
+
+    def __call__(self, t):
+        # (M,) times -> (M, 2) float positions
+        t = np.clip(np.asarray(t, dtype=np.float64), self.edges[0], self.edges[-1])
+        piece = np.clip(np.searchsorted(self.edges, t, side='right') - 1, 0, len(self.coefficients) - 1)
+        dt = (t - self.edges[piece])[:, None]
+        coefficients = self.coefficients[piece]
+        # Horner's rule over all pieces at once
+        result = coefficients[..., 0]
+        for k in range(1, coefficients.shape[-1]):
+            result = result * dt + coefficients[..., k]
+        return result
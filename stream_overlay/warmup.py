@@ -0,0 +1,27 @@
+# verdicts whose decision boxes are drawn ahead of time, and the frame sizes they are drawn for
+WARM_VERDICTS = (
+    ("IN-LINE", "IN-LINE", "HITTING", "OUT"),
+    ("IN-LINE", "IN-LINE", "MISSING", "NOT OUT"),
+    ("IN-LINE", "OUTSIDE OFF", "MISSING", "NOT OUT"),
+    ("OUTSIDE LEG", "N/A", "MISSING", "NOT OUT"),
+)
+WARM_FRAME_SIZES = ((1280, 720), (1920, 1080))
+
+
+def warm_up(frame_sizes=WARM_FRAME_SIZES, verdicts=WARM_VERDICTS):
+    '''
+    Imports the render path and fills the HUD sprite cache, so the first render
+    in this process does not pay for importing OpenCV, loading its fonts or
+    rasterising the decision boxes. Meant as a process pool initializer.
+    '''
+    from .draw_trajectory_new import TrajectoryOverlayRenderer  # noqa: F401 (pulls in cv2 and numpy)
+    from .hud import get_hud_sprite
+
+    for frame_size in frame_sizes:
+        for values in verdicts:
+            get_hud_sprite(frame_size, values)
+
+
+def ping():
+    # Trivial task used to make a pool start its worker processes
+    return True